@@ -1,78 +1,569 @@
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from typing import Dict, TypedDict, Annotated
-import os
-import mimetypes
-from config import get_config
-
-def process_document(file_path: str) -> str:
-    """Process the uploaded document and extract its content."""
-    # Get current configuration
-    config = get_config()
-    
-    # Detect file type using mimetypes
-    file_type, _ = mimetypes.guess_type(file_path)
-    
-    if file_type == 'text/plain':
-        loader = TextLoader(file_path)
-    elif file_type == 'application/pdf':
-        loader = PyPDFLoader(file_path)
-    else:
-        raise ValueError(f"Unsupported file type: {file_type}")
-        
-    documents = loader.load()
-    
-    text_splitter = RecursiveCharacterTextSplitter(
+from typing import Callable, Dict, Iterator, List, Optional, Union
+from dataclasses import dataclass, field
+from itertools import islice
+import asyncio
+import re
+import time
+from config import get_config, AIConfig
+import documents
+from documents import DocumentSource
+from llm_cache import llm_cache
+from llm_clients import llm_registry, get_prompt, scheduled
+from jobs import run_async
+import metrics
+import selection
+import summarize
+
+def _report(progress: Optional[Callable[[str], None]], stage: str):
+    if progress is not None:
+        progress(stage)
+
+# Map-reduce summaries are sized in characters; roughly four per token
+SUMMARY_CHARS_PER_TOKEN = 4
+
+# Multi-post generation prompts, overridable through config.prompts
+DEFAULT_OUTLINE_PROMPT = (
+    "Plan a social media thread of {count} posts about the following content. "
+    "Reply with exactly {count} lines, each a short topic for one post, in thread order: {content}"
+)
+DEFAULT_POST_PROMPT = (
+    "Write post {number} of {count} in a social media thread. The thread outline is:\n{outline}\n\n"
+    "This post covers: {topic}\n\nBe conversational, use emojis where appropriate and stay under "
+    "{max_chars} characters. Reply with the post text only. Source content: {content}"
+)
+DEFAULT_SHORTEN_PROMPT = (
+    "Rewrite this social media post in under {max_chars} characters, keeping its key point. "
+    "Reply with the post text only: {post}"
+)
+
+_OUTLINE_MARKER_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+@dataclass
+class IngestionStats:
+    pages_parsed: int = 0  # PDF pages, or blocks of a text document
+    bytes_read: int = 0  # UTF-8 bytes of extracted page text
+    chunks: int = 0
+
+@dataclass
+class Chunk:
+    text: str
+    index: int
+    start: int  # character offset into the document's extracted text
+    end: int
+    page: Optional[int] = None
+
+@dataclass
+class ChunkedDocument:
+    """Chunks handed from ingestion to generation, in document order."""
+    chunks: List[Chunk] = field(default_factory=list)
+    stats: IngestionStats = field(default_factory=IngestionStats)
+
+    @classmethod
+    def from_text(cls, text: str, config: AIConfig) -> "ChunkedDocument":
+        """Chunk an in-memory string the same way uploaded files are chunked."""
+        text_splitter = _make_splitter(config)
+        document = cls()
+        for chunk in _split_page(text_splitter, text, None, 0, 0):
+            if chunk.index >= config.chunk_limit:
+                break
+            document.chunks.append(chunk)
+        document.stats = IngestionStats(pages_parsed=1, bytes_read=len(text.encode("utf-8")), chunks=len(document.chunks))
+        return document
+
+    def text(self, limit: Optional[int] = None) -> str:
+        """Join the first ``limit`` chunks (all by default) into prompt content."""
+        return "\n".join(chunk.text for chunk in self.chunks[:limit])
+
+def _make_splitter(config: AIConfig) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=config.chunk_size,
         chunk_overlap=config.chunk_overlap
     )
+
+def _split_page(text_splitter, text: str, page: Optional[int], first_index: int, page_offset: int) -> Iterator[Chunk]:
+    cursor = 0
+    for i, piece in enumerate(text_splitter.split_text(text)):
+        # Chunks overlap, so search forward from just past the previous start
+        start = text.find(piece, cursor)
+        if start < 0:
+            start = cursor
+        cursor = start + 1
+        yield Chunk(
+            text=piece,
+            index=first_index + i,
+            start=page_offset + start,
+            end=page_offset + start + len(piece),
+            page=page
+        )
+
+def iter_document_chunks(
+    source: DocumentSource,
+    config: AIConfig,
+    stats: Optional[IngestionStats] = None,
+    progress: Optional[Callable[[str], None]] = None
+) -> Iterator[Chunk]:
+    """Lazily load pages and yield their chunks one at a time.
+
+    ``source`` is a path, a bytes-like object or a binary file object; the
+    type comes from its leading bytes, not its name. Pages are only parsed
+    as chunks are consumed, so a caller that stops iterating early never
+    pays for the rest of the document.
+    """
+    text_splitter = _make_splitter(config)
+    stats = stats if stats is not None else IngestionStats()
+    page_offset = 0
     
-    splits = text_splitter.split_documents(documents)
-    return "\n".join([doc.page_content for doc in splits[:config.max_chunks]])
+    _report(progress, "parsing")
+    # Parsing and splitting interleave page by page, so time each separately
+    parse_seconds = split_seconds = 0.0
+    try:
+        with documents.open_source(source) as stream:
+            started = time.perf_counter()
+            pages = documents.iter_pages(stream, documents.detect_type(stream))
+            parse_seconds += time.perf_counter() - started
+            while True:
+                started = time.perf_counter()
+                page = next(pages, None)
+                parse_seconds += time.perf_counter() - started
+                if page is None:
+                    break
+                
+                text, page_number = page
+                stats.pages_parsed += 1
+                stats.bytes_read += len(text.encode("utf-8"))
+                if stats.pages_parsed == 1:
+                    _report(progress, "splitting")
+                started = time.perf_counter()
+                chunks = list(_split_page(text_splitter, text, page_number, stats.chunks, page_offset))
+                split_seconds += time.perf_counter() - started
+                for chunk in chunks:
+                    stats.chunks += 1
+                    yield chunk
+                page_offset += len(text)
+    finally:
+        metrics.observe_stage("parse", parse_seconds)
+        metrics.observe_stage("split", split_seconds)
 
-class ThreadState(TypedDict):
-    content: str
-    thread_parts: list
-    complete: bool
+def process_document(
+    source: DocumentSource,
+    progress: Optional[Callable[[str], None]] = None,
+    config: Optional[AIConfig] = None
+) -> ChunkedDocument:
+    """Process the uploaded document into its leading chunks.
 
-def create_thread(content: str) -> Dict:
-    """Create a thread from the document content using LangChain."""
-    # Get current configuration
-    config = get_config()
+    Parsing stops as soon as ``config.chunk_limit`` chunks have been
+    produced; the returned document's ``stats`` show how much of the file
+    was read.
+    """
+    # Use the caller's config snapshot or the current configuration
+    config = config or get_config()
     
-    # Split content into smaller chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=config.chunk_size * 2,  # Larger chunks for thread creation
-        chunk_overlap=config.chunk_overlap
-    )
-    chunks = text_splitter.split_text(content)
+    document = ChunkedDocument()
+    chunks = iter_document_chunks(source, config, document.stats, progress)
+    try:
+        document.chunks = list(islice(chunks, config.chunk_limit))
+    finally:
+        chunks.close()
     
-    # Initialize LLM with configuration
-    llm = ChatOpenAI(
-        model_name=config.model_name,
-        temperature=config.temperature,
-        max_tokens=config.max_tokens
+    if not document.chunks:
+        raise ValueError("No text could be extracted from the document")
+    return document
+
+def _cache_key(prompt: str, config: AIConfig) -> str:
+    return llm_cache.make_key(prompt, config.model_name, config.temperature, config.max_tokens)
+
+def _cached_invoke(chain, prompt: str, config: AIConfig, use_cache: bool = True) -> str:
+    """Invoke ``chain`` on a rendered prompt, going through the response cache."""
+    key = _cache_key(prompt, config)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            metrics.observe_llm_call(config.model_name, "hit")
+            return cached
+    started = time.perf_counter()
+    result = chain.invoke(prompt)
+    metrics.observe_llm_call(config.model_name, "miss" if use_cache else "bypass", time.perf_counter() - started)
+    llm_cache.set(key, result)
+    return result
+
+async def _acached_invoke(chain, prompt: str, config: AIConfig, use_cache: bool = True) -> str:
+    """Async variant of _cached_invoke."""
+    key = _cache_key(prompt, config)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            metrics.observe_llm_call(config.model_name, "hit")
+            return cached
+    started = time.perf_counter()
+    result = await chain.ainvoke(prompt)
+    metrics.observe_llm_call(config.model_name, "miss" if use_cache else "bypass", time.perf_counter() - started)
+    llm_cache.set(key, result)
+    return result
+
+def _get_chain(config: AIConfig, llm=None):
+    # Reuse the pooled client for this config unless a model was supplied;
+    # either way calls go through the shared rate limiter
+    if llm is None:
+        return scheduled(llm_registry.get_chain(config), config)
+    return scheduled(llm | StrOutputParser(), config)
+
+def select_content(document: ChunkedDocument, config: AIConfig, budget: int) -> str:
+    """Join the chunks chosen by ``config.chunk_selection`` into at most ``budget`` tokens."""
+    texts = [chunk.text for chunk in document.chunks]
+    with metrics.timed("select"):
+        indexes = selection.select_chunks(
+            texts, budget, config.model_name, rank=config.chunk_selection == "salient"
+        )
+        if len(indexes) == 1:
+            # A single chunk can be larger than the whole budget
+            return selection.truncate_tokens(texts[indexes[0]], budget, config.model_name)
+        return "\n".join(texts[i] for i in indexes)
+
+def _post_content(document: ChunkedDocument, config: AIConfig, content: Optional[str]) -> str:
+    return content if content is not None else select_content(document, config, config.post_token_budget)
+
+def _build_generation(document: ChunkedDocument, config: AIConfig, llm=None, content: Optional[str] = None):
+    """Build the LLM chain and render the title and post prompts.
+
+    ``llm`` overrides the configured ChatOpenAI model, e.g. with a fake
+    chat model in tests. ``content`` replaces the selected chunks in both
+    prompts, e.g. with a map-reduce summary.
+    """
+    chain = _get_chain(config, llm)
+    
+    title_prompt = get_prompt(config.prompts["title"])
+    post_prompt = get_prompt(config.prompts["thread"])
+    title_content = content if content is not None else select_content(document, config, config.title_token_budget)
+    return (
+        chain,
+        title_prompt.format(content=title_content),
+        post_prompt.format(content=_post_content(document, config, content))
     )
-    output_parser = StrOutputParser()
+
+async def _asummarize_document(
+    document: ChunkedDocument,
+    config: AIConfig,
+    use_cache: bool = True,
+    llm=None
+) -> str:
+    """Summarize the whole document into prompt content for map-reduce mode."""
+    # Resolve the chain here so it uses the running loop's async pool
+    chain = _get_chain(config, llm)
+    # Reduce to about as much text as standard mode feeds the post prompt
+    budget = config.post_token_budget * SUMMARY_CHARS_PER_TOKEN
+    with metrics.timed("summarize"):
+        return await summarize.asummarize(chain, [chunk.text for chunk in document.chunks], config, budget, use_cache)
+
+def parse_outline(text: str, count: int) -> List[str]:
+    """Extract up to ``count`` post topics from an outline response."""
+    topics = [_OUTLINE_MARKER_RE.sub("", line).strip() for line in text.splitlines()]
+    topics = [topic for topic in topics if topic][:count]
+    if not topics:
+        raise ValueError("The outline did not contain any post topics")
+    return topics
+
+def _trim_post(post: str, max_chars: int) -> str:
+    if len(post) <= max_chars:
+        return post
+    # Cut at a word boundary when there is one in the second half
+    cut = post[:max_chars - 1]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+async def _agenerate_post(chain, prompt: str, config: AIConfig, use_cache: bool = True) -> str:
+    """Generate one post within ``post_max_chars``.
+
+    An over-long draft is sent back for a shorter rewrite, up to
+    ``post_retries`` times; a draft still over the limit is then trimmed.
+    Rate-limit errors and timeouts are retried by the scheduled chain, so
+    failures here propagate.
+    """
+    shorten_prompt = get_prompt(config.prompts.get("shorten") or DEFAULT_SHORTEN_PROMPT)
+    post = (await _acached_invoke(chain, prompt, config, use_cache)).strip()
+    for _ in range(config.post_retries):
+        if len(post) <= config.post_max_chars:
+            return post
+        prompt = shorten_prompt.format(max_chars=config.post_max_chars, post=post)
+        post = (await _acached_invoke(chain, prompt, config, use_cache)).strip()
+    return _trim_post(post, config.post_max_chars)
+
+async def _agenerate_posts(
+    content: str,
+    config: AIConfig,
+    use_cache: bool = True,
+    progress: Optional[Callable[[str], None]] = None,
+    llm=None
+) -> List[str]:
+    """Outline the thread, then write its posts concurrently.
+
+    At most ``post_concurrency`` post calls run at once, so latency is
+    about one outline call plus the slowest post.
+    """
+    # Resolve the chain here so it uses the running loop's async pool
+    chain = _get_chain(config, llm)
+    count = config.posts_per_thread
+    
+    _report(progress, "outline")
+    outline_prompt = get_prompt(config.prompts.get("outline") or DEFAULT_OUTLINE_PROMPT)
+    outline = await _acached_invoke(chain, outline_prompt.format(count=count, content=content), config, use_cache)
+    topics = parse_outline(outline, count)
+    outline_text = "\n".join(f"{number}. {topic}" for number, topic in enumerate(topics, 1))
+    
+    _report(progress, "post")
+    post_prompt = get_prompt(config.prompts.get("post") or DEFAULT_POST_PROMPT)
+    semaphore = asyncio.Semaphore(config.post_concurrency)
     
-    # Create title from first chunk using configured prompt
-    title_prompt = PromptTemplate.from_template(config.prompts["title"])
-    title_chain = title_prompt | llm | output_parser
-    title = title_chain.invoke({"content": chunks[0]})
+    async def generate(number: int, topic: str) -> str:
+        async with semaphore:
+            prompt = post_prompt.format(
+                number=number,
+                count=len(topics),
+                outline=outline_text,
+                topic=topic,
+                max_chars=config.post_max_chars,
+                content=content
+            )
+            return await _agenerate_post(chain, prompt, config, use_cache)
     
-    # Combine chunks into one content piece (limited to preserve context)
-    combined_content = " ".join(chunks[:3])
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(generate(number, topic)) for number, topic in enumerate(topics, 1)]
+    except ExceptionGroup as group_error:
+        raise group_error.exceptions[0]
+    return [task.result() for task in tasks]
+
+def create_thread(
+    document: ChunkedDocument,
+    progress: Optional[Callable[[str], None]] = None,
+    use_cache: bool = True,
+    config: Optional[AIConfig] = None
+) -> Dict:
+    """Create a thread from the document's chunks using LangChain."""
+    # Use the caller's config snapshot or the current configuration
+    config = config or get_config()
+    if config.posts_per_thread > 1:
+        # Multi-post generation runs its post calls concurrently
+        return run_async(acreate_thread(document, progress, use_cache, config))
+    
+    content = None
+    if config.generation_mode == "map_reduce":
+        _report(progress, "summarizing")
+        content = run_async(_asummarize_document(document, config, use_cache))
+    chain, title_prompt, post_prompt = _build_generation(document, config, content=content)
+    
+    # Create title using configured prompt
+    _report(progress, "title")
+    title = _cached_invoke(chain, title_prompt, config, use_cache)
     
     # Generate thread post using configured prompt
-    post_prompt = PromptTemplate.from_template(config.prompts["thread"])
-    post_chain = post_prompt | llm | output_parser
-    post = post_chain.invoke({"content": combined_content})
+    _report(progress, "post")
+    post = _cached_invoke(chain, post_prompt, config, use_cache)
     posts = [{"content": post}]
     
     return {
         "title": title,
         "posts": posts
     }
+
+async def acreate_thread(
+    document: ChunkedDocument,
+    progress: Optional[Callable[[str], None]] = None,
+    use_cache: bool = True,
+    config: Optional[AIConfig] = None
+) -> Dict:
+    """Create a thread with the title and post requests running concurrently.
+
+    With ``posts_per_thread`` above one, the title is written alongside
+    the outline and its posts. Each attempt is bounded by ``request_timeout``;
+    if any call fails the others are cancelled and the first error is raised.
+    """
+    config = config or get_config()
+    content = None
+    if config.generation_mode == "map_reduce":
+        _report(progress, "summarizing")
+        content = await _asummarize_document(document, config, use_cache)
+    chain, title_prompt, post_prompt = _build_generation(document, config, content=content)
+    
+    _report(progress, "title")
+    try:
+        async with asyncio.TaskGroup() as group:
+            title_task = group.create_task(_acached_invoke(chain, title_prompt, config, use_cache))
+            if config.posts_per_thread > 1:
+                posts_task = group.create_task(_agenerate_posts(
+                    _post_content(document, config, content),
+                    config,
+                    use_cache,
+                    progress
+                ))
+            else:
+                post_task = group.create_task(_acached_invoke(chain, post_prompt, config, use_cache))
+                
+                def title_done(task):
+                    # Only the post remains once the title is back
+                    if not post_task.done():
+                        _report(progress, "post")
+                title_task.add_done_callback(title_done)
+    except ExceptionGroup as group_error:
+        raise group_error.exceptions[0]
+    
+    if config.posts_per_thread > 1:
+        posts = posts_task.result()
+    else:
+        posts = [post_task.result()]
+    return {
+        "title": title_task.result(),
+        "posts": [{"content": post} for post in posts]
+    }
+
+def create_threads(
+    documents: List[ChunkedDocument],
+    use_cache: bool = True,
+    config: Optional[AIConfig] = None,
+    max_concurrency: int = 4
+) -> List[Union[Dict, Exception]]:
+    """Create threads for several documents with one batched LLM pass.
+
+    Title and post prompts for every document go through ``chain.batch``
+    with at most ``max_concurrency`` calls in flight. Returns one entry per
+    document: the thread, or the exception that prevented it. In map-reduce
+    mode each document is summarized first, one document at a time.
+    Multi-post threads run through acreate_thread instead, with up to
+    ``max_concurrency`` documents in flight.
+    """
+    config = config or get_config()
+    if config.posts_per_thread > 1:
+        async def create_all():
+            semaphore = asyncio.Semaphore(max_concurrency)
+            
+            async def create(document):
+                async with semaphore:
+                    return await acreate_thread(document, use_cache=use_cache, config=config)
+            return await asyncio.gather(*(create(document) for document in documents), return_exceptions=True)
+        return list(run_async(create_all()))
+    
+    chain = _get_chain(config)
+    
+    contents = [None] * len(documents)
+    if config.generation_mode == "map_reduce":
+        async def summarize_all():
+            for i, document in enumerate(documents):
+                try:
+                    contents[i] = await _asummarize_document(document, config, use_cache)
+                except Exception as e:
+                    contents[i] = e
+        run_async(summarize_all())
+    
+    prompts = []
+    for document, content in zip(documents, contents):
+        # A failed summary is carried through as both of the document's results
+        if isinstance(content, Exception):
+            prompts.extend([content, content])
+            continue
+        _, title_prompt, post_prompt = _build_generation(document, config, content=content)
+        prompts.extend([title_prompt, post_prompt])
+    
+    # Serve what we can from the cache and batch the rest
+    results = [None] * len(prompts)
+    pending = []
+    for i, prompt in enumerate(prompts):
+        if isinstance(prompt, Exception):
+            results[i] = prompt
+            continue
+        cached = llm_cache.get(_cache_key(prompt, config)) if use_cache else None
+        if cached is not None:
+            metrics.observe_llm_call(config.model_name, "hit")
+            results[i] = cached
+        else:
+            pending.append(i)
+    
+    if pending:
+        # Calls overlap, so the batch is timed as a whole
+        with metrics.timed("llm_batch"):
+            outputs = chain.batch(
+                [prompts[i] for i in pending],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+        for i, output in zip(pending, outputs):
+            metrics.observe_llm_call(config.model_name, "miss" if use_cache else "bypass")
+            results[i] = output
+            if not isinstance(output, Exception):
+                llm_cache.set(_cache_key(prompts[i], config), output)
+    
+    threads = []
+    for title, post in zip(results[0::2], results[1::2]):
+        error = next((r for r in (title, post) if isinstance(r, Exception)), None)
+        threads.append(error or {"title": title, "posts": [{"content": post}]})
+    return threads
+
+def _stream_part(chain, prompt: str, config: AIConfig, use_cache: bool) -> Iterator[str]:
+    key = _cache_key(prompt, config)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            metrics.observe_llm_call(config.model_name, "hit")
+            yield cached
+            return
+    started = time.perf_counter()
+    parts = []
+    for token in chain.stream(prompt):
+        parts.append(token)
+        yield token
+    metrics.observe_llm_call(config.model_name, "miss" if use_cache else "bypass", time.perf_counter() - started)
+    llm_cache.set(key, "".join(parts))
+
+def stream_thread(
+    document: ChunkedDocument,
+    use_cache: bool = True,
+    llm=None,
+    config: Optional[AIConfig] = None
+) -> Iterator[Dict]:
+    """Stream a thread as it is generated.
+
+    Yields ``{"event": "title" | "post", "data": token}`` for each token,
+    title first, followed by a single ``{"event": "complete", "data": thread}``
+    carrying the same structure create_thread returns. In map-reduce mode a
+    ``{"event": "stage", "data": "summarizing"}`` message comes first. With
+    several posts per thread, the posts are generated concurrently after the
+    title and each is sent as a single ``post`` message.
+    """
+    config = config or get_config()
+    content = None
+    if config.generation_mode == "map_reduce":
+        yield {"event": "stage", "data": "summarizing"}
+        content = run_async(_asummarize_document(document, config, use_cache, llm))
+    chain, title_prompt, post_prompt = _build_generation(document, config, llm, content)
+    
+    title_parts = []
+    for token in _stream_part(chain, title_prompt, config, use_cache):
+        title_parts.append(token)
+        yield {"event": "title", "data": token}
+    
+    if config.posts_per_thread > 1:
+        yield {"event": "stage", "data": "outline"}
+        posts = run_async(_agenerate_posts(
+            _post_content(document, config, content),
+            config,
+            use_cache,
+            llm=llm
+        ))
+        for post in posts:
+            yield {"event": "post", "data": post + "\n\n"}
+    else:
+        post_parts = []
+        for token in _stream_part(chain, post_prompt, config, use_cache):
+            post_parts.append(token)
+            yield {"event": "post", "data": token}
+        posts = ["".join(post_parts)]
+    
+    yield {
+        "event": "complete",
+        "data": {
+            "title": "".join(title_parts),
+            "posts": [{"content": post} for post in posts]
+        }
+    }
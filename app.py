@@ -1,57 +1,130 @@
+import asyncio
+import hashlib
+import inspect
 import os
-from flask import Flask, render_template, request, jsonify, flash, make_response, redirect, url_for, session
-from werkzeug.utils import secure_filename
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
-import tempfile
+import json
+import logging
+import math
+from typing import Optional
+from flask import Blueprint, Flask, Response, current_app, render_template, request, jsonify, flash, make_response, redirect, url_for, session, stream_with_context
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from functools import wraps
+from werkzeug.http import is_resource_modified
 from dotenv import load_dotenv
-from supabase_client import sign_up, sign_in, sign_out, get_user, save_thread, get_user_threads, get_thread, delete_thread, update_user_config, get_user_config
-from asgiref.sync import async_to_sync
+from auth import create_session_validator
+from config import AIConfig, config_provider
+import dedup
+import documents
+from jobs import create_job_backend, run_async, QueueFullError
+import metrics
+from models import db
+import rate_limit
+import rendering
+from store import history_key, thread_store
+from warmup import WarmUp
+import supabase_client
+from supabase_client import (
+    sign_up, sign_in, sign_out, get_user, get_user_threads_page, update_user_config, get_user_config, run_sync
+)
 
 # Load environment variables
 load_dotenv()
 
-class Base(DeclarativeBase):
-    pass
-
-db = SQLAlchemy(model_class=Base)
-app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY", "your-secret-key-here")
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///threads.db"
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+metrics.configure_logging(os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
 ALLOWED_EXTENSIONS = {'txt', 'pdf'}
 
-db.init_app(app)
+session_validator = create_session_validator(lambda token: run_sync(get_user(token)))
+config_provider.user_loader = lambda user_id: run_sync(get_user_config(user_id))
+config_provider.user_ttl = float(os.getenv("USER_CONFIG_TTL", 60))
+job_queue = create_job_backend(
+    os.getenv("JOB_BACKEND", "thread"),
+    max_workers=int(os.getenv("JOB_WORKERS", 4)),
+    max_queue_depth=int(os.getenv("JOB_QUEUE_DEPTH", 32))
+)
+# Streamed uploads generate on the request thread, so only this many run at once
+stream_slots = threading.BoundedSemaphore(int(os.getenv("STREAM_CONCURRENCY", 4)))
+
+bp = Blueprint('main', __name__)
+
+def _login_redirect():
+    flash('Please log in to access this page.', 'error')
+    return redirect(url_for('main.login'))
+
+def _expired_redirect():
+    session.clear()
+    flash('Session expired. Please log in again.', 'error')
+    return redirect(url_for('main.login'))
 
 def login_required(f):
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def async_decorated_function(*args, **kwargs):
+            if 'access_token' not in session:
+                return _login_redirect()
+            
+            user, error = await session_validator.avalidate(session['access_token'])
+            if error or not user:
+                return _expired_redirect()
+            
+            return await f(*args, **kwargs)
+        return async_decorated_function
+    
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'access_token' not in session:
-            flash('Please log in to access this page.', 'error')
-            return redirect(url_for('login'))
+            return _login_redirect()
         
-        user, error = async_to_sync(get_user)(session['access_token'])
+        user, error = session_validator.validate(session['access_token'])
         if error or not user:
-            session.clear()
-            flash('Session expired. Please log in again.', 'error')
-            return redirect(url_for('login'))
+            return _expired_redirect()
         
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/login', methods=['GET', 'POST'])
-def login():
+def _discard(task):
+    task.cancel()
+    # Retrieve an exception it may already have raised so it is not logged as unhandled
+    task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+def login_required_prefetch(fetch):
+    """login_required for async views that overlap session validation with a read-only fetch.
+
+    ``fetch(*args, **kwargs)`` starts while the session is validated and
+    must not write anything, caches included. The view runs only once the
+    session is valid and gets the pending fetch as ``prefetched`` to await.
+    If validation fails or raises, the fetch is cancelled.
+    """
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(*args, **kwargs):
+            if 'access_token' not in session:
+                return _login_redirect()
+            
+            prefetched = asyncio.ensure_future(fetch(*args, **kwargs))
+            try:
+                user, error = await session_validator.avalidate(session['access_token'])
+            except BaseException:
+                _discard(prefetched)
+                raise
+            if error or not user:
+                _discard(prefetched)
+                return _expired_redirect()
+            return await f(*args, prefetched=prefetched, **kwargs)
+        return decorated_function
+    return decorator
+
+@bp.route('/login', methods=['GET', 'POST'])
+async def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
         
-        auth_data, error = async_to_sync(sign_in)(email, password)
+        auth_data, error = await sign_in(email, password)
         if error:
             flash(f'Login failed: {error}', 'error')
             return render_template('login.html')
@@ -59,16 +132,18 @@ def login():
         if auth_data and auth_data.get('session') and auth_data.get('user'):
             session['access_token'] = auth_data['session'].access_token
             session['user_id'] = auth_data['user'].id
+            # Threads held only in Supabase become searchable once copied into the local store
+            threading.Thread(target=thread_store.backfill_user, args=(session['user_id'],), daemon=True).start()
             flash('Successfully logged in!', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         else:
             flash('Login failed: Invalid response from authentication server', 'error')
             return render_template('login.html')
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
-def register():
+@bp.route('/register', methods=['GET', 'POST'])
+async def register():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
@@ -82,28 +157,52 @@ def register():
             flash('Password must be at least 6 characters long.', 'error')
             return render_template('register.html')
         
-        user, error = async_to_sync(sign_up)(email, password)
+        user, error = await sign_up(email, password)
         if error:
             flash(f'Registration failed: {error}', 'error')
             return render_template('register.html')
         
         flash('Registration successful! Please check your email to verify your account.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('register.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
-def logout():
-    success, error = async_to_sync(sign_out)(session.get('access_token'))
+async def logout():
+    success, error = await sign_out(session.get('access_token'))
+    session_validator.revoke(session['access_token'])
     session.clear()
     if error:
         flash(f'Logout failed: {error}', 'error')
     else:
         flash('Successfully logged out!', 'success')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
+
+@bp.route('/auth/stats')
+@login_required
+def auth_stats():
+    return jsonify(session_validator.stats())
+
+@bp.route('/llm/stats')
+@login_required
+def llm_stats():
+    return jsonify(rate_limit.scheduler.stats())
 
-@app.route('/')
+@bp.route('/ready')
+def ready():
+    status = current_app.extensions['warm_up'].status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    body, content_type = metrics.render_latest()
+    return Response(body, content_type=content_type)
+
+@bp.route('/')
 @login_required
 def index():
     return render_template('index.html')
@@ -111,9 +210,98 @@ def index():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/upload', methods=['POST'])
+def _submit_job(user_id, fn, *args):
+    """Queue ``fn(report, *args)`` to run inside this app's context on a job worker."""
+    app = current_app._get_current_object()
+    
+    def run(report, *job_args):
+        with app.app_context():
+            return fn(report, *job_args)
+    return job_queue.submit(user_id, run, *args)
+
+def find_duplicate(user_id, document):
+    """Fingerprint a processed document and look up the user's most similar earlier one.
+
+    Returns ``(fingerprint, match)``; the fingerprint is None for a document
+    without words and the match is None when nothing indexed reaches
+    ``DEDUP_THRESHOLD``.
+    """
+    with metrics.timed("fingerprint"):
+        fingerprint = dedup.fingerprint([chunk.text for chunk in document.chunks])
+    if fingerprint is None:
+        return None, None
+    return fingerprint, thread_store.find_similar(user_id, fingerprint, current_app.config['DEDUP_THRESHOLD'])
+
+def _offer_duplicate(match, duplicates):
+    """Whether to answer with ``match`` instead of generating a thread."""
+    if match is None:
+        return False
+    offered = duplicates != 'regenerate'
+    metrics.DUPLICATE_UPLOADS.labels('offered' if offered else 'regenerated').inc()
+    return offered
+
+def _reproduces(row, thread_data):
+    """Whether generated ``thread_data`` is exactly the thread in ``row``."""
+    return bool(row) and row['title'] == thread_data['title'] and \
+        row['content'] == [post['content'] for post in thread_data['posts']]
+
+def generate_thread_job(report, upload, user_id, use_cache, config, duplicates='offer'):
+    """Run the document-to-thread pipeline for a spooled upload with a config snapshot.
+
+    When the user already has a thread from a near-identical document, the
+    result describes that match instead, unless ``duplicates`` is
+    "regenerate". Regeneration runs the whole pipeline; with the cache on,
+    prompts that are unchanged (such as map-reduce summaries of unchanged
+    chunks) are served from it. If that reproduces the matched thread
+    exactly, its id is returned rather than saving a copy.
+    """
+    from agents import process_document
+
+    rate_limit.set_caller(user_id)
+    # Process document, then generate and save the thread on the worker's event loop
+    try:
+        document = process_document(upload, progress=report, config=config)
+    finally:
+        upload.close()
+    
+    fingerprint, match = find_duplicate(user_id, document)
+    if _offer_duplicate(match, duplicates):
+        return match.to_dict()
+    return run_async(_generate_and_save(report, document, user_id, use_cache, config, fingerprint, match))
+
+def spool_upload(file):
+    """Copy an uploaded file into a buffer the job can read after the request ends."""
+    with metrics.timed("spool"):
+        return documents.spool(file.stream)
+
+async def _generate_and_save(report, document, user_id, use_cache, config, fingerprint=None, match=None):
+    from agents import acreate_thread
+
+    with metrics.timed("generate"):
+        thread_data = await acreate_thread(document, progress=report, use_cache=use_cache, config=config)
+    
+    if match is not None:
+        existing, _ = await thread_store.aget_thread(match.thread_id)
+        if _reproduces(existing, thread_data):
+            return {'thread_id': match.thread_id}
+    
+    # Save locally; the store flushes it to Supabase in the background
+    report('saving')
+    thread, error = thread_store.save_thread(
+        user_id,
+        thread_data['title'],
+        [post['content'] for post in thread_data['posts']],
+        fingerprint=fingerprint
+    )
+    
+    if error:
+        raise RuntimeError(error)
+    
+    return {'thread_id': thread['id']}
+
+@bp.route('/upload', methods=['POST'])
 @login_required
-def upload_file():
+async def upload_file():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -122,82 +310,454 @@ def upload_file():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        user_id = session['user_id']
+        # Clients can force fresh generation with no_cache=1
+        use_cache = request.form.get('no_cache') != '1'
+        # With duplicates=regenerate, a near-duplicate upload is generated rather than offered back
+        duplicates = request.form.get('duplicates', 'offer')
+        
+        # Fetch the config snapshot for the job while the upload is spooled
+        config, upload = await asyncio.gather(
+            asyncio.to_thread(config_provider.get_for_user, user_id),
+            asyncio.to_thread(spool_upload, file)
+        )
         
         try:
-            # Process document and create thread
-            document_content = process_document(filepath)
-            thread_data = create_thread(document_content)
+            job = _submit_job(user_id, generate_thread_job, upload, user_id, use_cache, config, duplicates)
+        except QueueFullError as e:
+            upload.close()
+            response = jsonify({'error': str(e)})
+            response.headers['Retry-After'] = '5'
+            return response, 429
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id
+        }), 202
             
-            # Save thread to Supabase
-            thread, error = async_to_sync(save_thread)(
-                session['user_id'],
-                thread_data['title'],
-                [post['content'] for post in thread_data['posts']]
+    return jsonify({'error': 'Invalid file type'}), 400
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool():
+    """Process pool for CPU-bound document parsing, created on first use."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # Spawn rather than fork: the web process is multi-threaded
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=current_app.config['BATCH_PARSE_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn')
             )
+        return _parse_pool
+
+def _discard_parse_pool(pool):
+    """Drop a pool whose worker died so the next ``get_parse_pool`` builds a new one."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _submit_parse(fn, data, config):
+    """Submit ``fn(data, None, config)`` to the parse pool, replacing it if broken; returns ``(pool, future)``."""
+    pool = get_parse_pool()
+    try:
+        return pool, pool.submit(fn, data, None, config)
+    except BrokenProcessPool:
+        _discard_parse_pool(pool)
+        pool = get_parse_pool()
+        return pool, pool.submit(fn, data, None, config)
+
+def generate_batch_job(report, uploads, user_id, use_cache=True, duplicates='offer'):
+    """Turn several uploaded documents into threads.
+
+    ``uploads`` is a list of ``(filename, spooled upload)``. Documents are
+    parsed in parallel, generated with one batched LLM pass and saved with a
+    single bulk insert. Failures are recorded per file instead of aborting
+    the batch, and near-duplicates of earlier documents are marked
+    "duplicate" with the existing thread unless ``duplicates`` is
+    "regenerate".
+    """
+    from agents import create_threads, process_document
+
+    # Batches queue behind interactive and single-document calls
+    rate_limit.set_caller(user_id, 'batch')
+    config = config_provider.get_for_user(user_id)
+    results = [{'filename': filename, 'status': 'failed', 'thread_id': None, 'error': None} for filename, _ in uploads]
+    
+    report('parsing')
+    futures = []
+    for _, upload in uploads:
+        # Parse workers get the bytes themselves; open files don't cross processes
+        with upload:
+            data = upload.read()
+        futures.append((data, _submit_parse(process_document, data, config)))
+    parsed = []
+    for i, (data, (pool, future)) in enumerate(futures):
+        try:
+            parsed.append((i, future.result()))
+        except BrokenProcessPool:
+            # A dead worker (e.g. out of memory on a large PDF) fails every task in its pool;
+            # parse this document once more on a new pool so only the culprit fails
+            _discard_parse_pool(pool)
+            try:
+                parsed.append((i, _submit_parse(process_document, data, config)[1].result()))
+            except Exception as e:
+                results[i]['error'] = str(e)
+        except Exception as e:
+            results[i]['error'] = str(e)
+    
+    fingerprints, matches = {}, {}
+    for i, document in parsed:
+        fingerprints[i], matches[i] = find_duplicate(user_id, document)
+        if _offer_duplicate(matches[i], duplicates):
+            results[i].update(matches[i].to_dict(), status='duplicate', thread_id=matches[i].thread_id)
+    parsed = [(i, document) for i, document in parsed if results[i]['status'] != 'duplicate']
+    
+    report('generating')
+    with metrics.timed("generate"):
+        threads = create_threads(
+            [document for _, document in parsed],
+            use_cache=use_cache,
+            config=config,
+            max_concurrency=current_app.config['BATCH_LLM_CONCURRENCY']
+        )
+    generated = []
+    for (i, _), thread_data in zip(parsed, threads):
+        if isinstance(thread_data, Exception):
+            results[i]['error'] = str(thread_data)
+        elif matches[i] is not None and _reproduces(thread_store.get_thread(matches[i].thread_id)[0], thread_data):
+            results[i].update(status='succeeded', thread_id=matches[i].thread_id)
+        else:
+            generated.append((i, thread_data))
+    
+    if generated:
+        report('saving')
+        rows, error = thread_store.save_threads(user_id, [
+            (thread_data['title'], [post['content'] for post in thread_data['posts']])
+            for _, thread_data in generated
+        ], [fingerprints[i] for i, _ in generated])
+        for position, (i, _) in enumerate(generated):
+            if error or not rows:
+                results[i]['error'] = str(error or 'Failed to save thread')
+            else:
+                results[i]['status'] = 'succeeded'
+                results[i]['thread_id'] = rows[position]['id']
+    
+    return {
+        'threads': results,
+        'succeeded': sum(1 for result in results if result['status'] == 'succeeded'),
+        'duplicates': sum(1 for result in results if result['status'] == 'duplicate'),
+        'failed': sum(1 for result in results if result['status'] == 'failed')
+    }
+
+@bp.route('/upload/batch', methods=['POST'])
+@login_required
+def upload_batch():
+    request.max_content_length = current_app.config['BATCH_MAX_CONTENT_LENGTH']
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if not files:
+        return jsonify({'error': 'No selected files'}), 400
+    if len(files) > current_app.config['BATCH_MAX_FILES']:
+        return jsonify({'error': f"At most {current_app.config['BATCH_MAX_FILES']} files per batch"}), 400
+    
+    uploads = []
+    rejected = []
+    for file in files:
+        if not allowed_file(file.filename):
+            rejected.append({'filename': file.filename, 'status': 'failed', 'thread_id': None, 'error': 'Invalid file type'})
+            continue
+        uploads.append((file.filename, spool_upload(file)))
+    
+    if not uploads:
+        return jsonify({'error': 'No valid files', 'threads': rejected}), 400
+    
+    use_cache = request.form.get('no_cache') != '1'
+    duplicates = request.form.get('duplicates', 'offer')
+    try:
+        job = _submit_job(session['user_id'], generate_batch_job, uploads, session['user_id'], use_cache, duplicates)
+    except QueueFullError as e:
+        for _, upload in uploads:
+            upload.close()
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'rejected': rejected
+    }), 202
+
+def _get_user_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None or job.user_id != session['user_id']:
+        return None
+    return job
+
+@bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = _get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@bp.route('/jobs/<job_id>/result')
+@login_required
+def job_result(job_id):
+    job = _get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.status == 'failed':
+        if job.retry_after is not None:
+            # Rate limited rather than broken: the client may resubmit later
+            response = jsonify({'error': job.error})
+            response.headers['Retry-After'] = str(math.ceil(job.retry_after))
+            return response, 503
+        return jsonify({'error': job.error}), 500
+    if job.status != 'succeeded':
+        return jsonify({'status': job.status, 'stage': job.stage}), 202
+    
+    return jsonify({'success': True, **job.result})
+
+def _sse(event, data):
+    """Format a Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@bp.route('/upload/stream', methods=['POST'])
+@login_required
+def upload_stream():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    if not stream_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many uploads are being streamed; try again shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    try:
+        upload = spool_upload(file)
+    except Exception:
+        stream_slots.release()
+        raise
+    user_id = session['user_id']
+    use_cache = request.form.get('no_cache') != '1'
+    duplicates = request.form.get('duplicates', 'offer')
+    
+    def generate():
+        from agents import process_document, stream_thread
+
+        # Someone is watching this stream, so its calls go first
+        rate_limit.set_caller(user_id, 'interactive')
+        try:
+            config = config_provider.get_for_user(user_id)
+            yield _sse('stage', 'parsing')
+            document = process_document(upload, config=config)
+            upload.close()
             
-            if error:
-                return jsonify({'error': str(error)}), 500
+            fingerprint, match = find_duplicate(user_id, document)
+            if _offer_duplicate(match, duplicates):
+                yield _sse('duplicate', match.to_dict())
+                return
             
-            # Clean up
-            os.remove(filepath)
+            thread_data = None
+            for message in stream_thread(document, use_cache=use_cache, config=config):
+                if message['event'] == 'complete':
+                    thread_data = message['data']
+                else:
+                    yield _sse(message['event'], message['data'])
             
-            return jsonify({
-                'success': True,
-                'thread_id': thread['id']
-            })
+            if match is not None and _reproduces(thread_store.get_thread(match.thread_id)[0], thread_data):
+                yield _sse('done', {'thread_id': match.thread_id})
+                return
             
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+            # Persist the finished thread once the stream has ended
+            yield _sse('stage', 'saving')
+            thread, error = thread_store.save_thread(
+                user_id,
+                thread_data['title'],
+                [post['content'] for post in thread_data['posts']],
+                fingerprint=fingerprint
+            )
+            if error:
+                yield _sse('error', str(error))
+                return
             
-    return jsonify({'error': 'Invalid file type'}), 400
+            yield _sse('done', {'thread_id': thread['id']})
+        except Exception as e:
+            yield _sse('error', str(e))
+        finally:
+            upload.close()
+    
+    def release():
+        # Runs when the response is closed, even if the stream was never started
+        upload.close()
+        stream_slots.release()
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.call_on_close(release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-@app.route('/thread/<thread_id>')
+async def _history_page():
+    """One page of the user's threads from Supabase, merged with local ones it does not have yet.
+
+    Raises ValueError for a malformed cursor.
+    """
+    user_id = session['user_id']
+    limit = max(min(request.args.get('limit', current_app.config['HISTORY_PAGE_SIZE'], type=int), current_app.config['HISTORY_MAX_PAGE_SIZE']), 1)
+    cursor = request.args.get('cursor')
+    before = supabase_client.decode_cursor(cursor) if cursor else None
+    page, error = await get_user_threads_page(user_id, limit, cursor)
+    if error:
+        return page, error
+    
+    # Threads still waiting for the write-behind flush belong on this page too
+    seen = {row['id'] for row in page['threads']}
+    pending = [row for row in thread_store.unsynced_summaries(user_id, before, limit) if row['id'] not in seen]
+    if not pending:
+        return page, None
+    rows = sorted(page['threads'] + pending, key=history_key, reverse=True)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return {'threads': rows, 'next_cursor': supabase_client.encode_cursor(rows[-1]['created_at'], rows[-1]['id'])}, None
+    return {'threads': rows, 'next_cursor': page['next_cursor']}, None
+
+@bp.route('/threads')
+@login_required_prefetch(_history_page)
+async def thread_history(prefetched):
+    try:
+        page, error = await prefetched
+    except ValueError:
+        flash('Invalid page cursor.', 'error')
+        return render_template('history.html', threads=[], next_cursor=None), 400
+    if error:
+        flash(f'Error loading your threads: {error}', 'error')
+        page = {'threads': [], 'next_cursor': None}
+    return render_template('history.html', threads=page['threads'], next_cursor=page['next_cursor'])
+
+@bp.route('/api/threads')
+@login_required_prefetch(_history_page)
+async def api_threads(prefetched):
+    try:
+        page, error = await prefetched
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    if error:
+        return jsonify({'error': str(error)}), 500
+    return jsonify(page)
+
+@bp.route('/api/threads/<thread_id>')
 @login_required
-def view_thread(thread_id):
-    thread, error = async_to_sync(get_thread)(thread_id)
-    if error or not thread:
+async def api_thread(thread_id):
+    thread, error = await thread_store.aget_thread(thread_id)
+    if error or not thread or thread['user_id'] != session['user_id']:
+        return jsonify({'error': 'Thread not found'}), 404
+    return jsonify(thread)
+
+def _search_page():
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    return query, thread_store.search(session['user_id'], query, page, current_app.config['SEARCH_PAGE_SIZE'])
+
+@bp.route('/search')
+@login_required
+def search_threads():
+    query, results = _search_page()
+    return render_template('search.html', query=query, **results)
+
+@bp.route('/api/search')
+@login_required
+def api_search():
+    query, results = _search_page()
+    return jsonify({'query': query, **results})
+
+async def _thread_fragment(thread_id, form, render):
+    """Return the cached ``form`` of a thread, building it with ``render(rendered_thread)`` on a miss.
+
+    Returns None if the thread does not exist.
+    """
+    fragment = rendering.fragment_cache.get(thread_id, form)
+    if fragment is None:
+        thread, error = await thread_store.aget_rendered(thread_id)
+        if error or not thread:
+            return None
+        fragment = rendering.fragment_cache.put(thread_id, form, thread['user_id'], render(thread), thread['updated_at'])
+    return fragment
+
+def _conditional_response(fragment, build, page_version=None):
+    """Answer 304 if the client's copy of ``fragment`` is current, else the response from ``build()``.
+
+    For a full page, ``page_version`` identifies the templates around the
+    fragment and is part of the ETag. A page is always rebuilt while flashed
+    messages are waiting, so they are shown and consumed.
+    """
+    etag = fragment.etag if page_version is None else f"{fragment.etag}-{page_version}"
+    if is_resource_modified(request.environ, etag=etag, last_modified=fragment.last_modified) or \
+            (page_version is not None and session.get('_flashes')):
+        response = make_response(build())
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = fragment.last_modified
+    # Only the owner may see it: browsers can keep a copy but must revalidate
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/thread/<thread_id>')
+@login_required
+async def view_thread(thread_id):
+    fragment = await _thread_fragment(
+        thread_id, 'html', lambda thread: render_template('thread_posts.html', display=thread['display'])
+    )
+    if fragment is None:
         flash('Thread not found.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    if thread['user_id'] != session['user_id']:
+    if fragment.user_id != session['user_id']:
         flash('You do not have permission to view this thread.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    return render_template('thread.html', thread=thread)
+    return _conditional_response(
+        fragment,
+        lambda: render_template('thread.html', thread_id=thread_id, posts_html=fragment.body),
+        current_app.config['PAGE_VERSION']
+    )
 
-@app.route('/thread/<thread_id>/export', methods=['GET'])
+@bp.route('/thread/<thread_id>/export', methods=['GET'])
 @login_required
-def export_thread(thread_id):
-    thread, error = async_to_sync(get_thread)(thread_id)
-    if error or not thread:
+async def export_thread(thread_id):
+    # The export text is computed when the thread is saved
+    fragment = await _thread_fragment(thread_id, 'export', lambda thread: thread['export'])
+    if fragment is None:
         flash('Thread not found.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    if thread['user_id'] != session['user_id']:
+    if fragment.user_id != session['user_id']:
         flash('You do not have permission to export this thread.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    # Clean and format the thread content for export
-    title = thread['title'].replace('**', '').replace('*', '').replace('"', '').strip()
-    content = f"🧵 {title}\n\n"
-    
-    for post_content in thread['content']:
-        cleaned_content = post_content.replace('**', '').replace('*', '').strip()
-        content += f"{cleaned_content}\n\n"
-    
-    # Create response with the content
-    response = make_response(content)
+    response = _conditional_response(fragment, lambda: fragment.body)
     response.headers['Content-Type'] = 'text/plain'
     response.headers['Content-Disposition'] = f'attachment; filename=thread_{thread_id}.txt'
     
     return response
 
-@app.route('/config', methods=['GET', 'POST'])
+@bp.route('/config', methods=['GET', 'POST'])
 @login_required
-def configure():
+async def configure():
     try:
         if request.method == 'POST':
             try:
@@ -208,28 +768,38 @@ def configure():
                     'chunk_size': int(request.form.get('chunk_size', 2000)),
                     'chunk_overlap': int(request.form.get('chunk_overlap', 100)),
                     'max_chunks': int(request.form.get('max_chunks', 10)),
+                    'chunk_selection': request.form.get('chunk_selection', 'salient'),
+                    'title_token_budget': int(request.form.get('title_token_budget', 400)),
+                    'post_token_budget': int(request.form.get('post_token_budget', 1500)),
+                    'generation_mode': request.form.get('generation_mode', 'standard'),
+                    'map_reduce_max_chunks': int(request.form.get('map_reduce_max_chunks', 200)),
+                    'posts_per_thread': int(request.form.get('posts_per_thread', 1)),
+                    'post_max_chars': int(request.form.get('post_max_chars', 280)),
                     'prompts': {
                         'title': request.form.get('title_prompt'),
                         'thread': request.form.get('thread_prompt')
                     }
                 }
                 
-                print(f"Updating config for user {session['user_id']}")  # Debug log
-                config, error = async_to_sync(update_user_config)(session['user_id'], config_data)
+                AIConfig.from_dict(config_data).validate()
+                
+                logger.debug("Updating config for user %s", session['user_id'])
+                config, error = await update_user_config(session['user_id'], config_data)
+                config_provider.invalidate_user(session['user_id'])
                 if error:
-                    print(f"Error updating config: {error}")  # Debug log
+                    logger.warning("Error updating config: %s", error)
                     flash(f'Error updating configuration: {error}', 'error')
                 else:
                     flash('Configuration updated successfully!', 'success')
             except (ValueError, TypeError) as e:
-                print(f"Error processing form data: {str(e)}")  # Debug log
+                logger.info("Invalid config form data: %s", e)
                 flash(f'Error updating configuration: {str(e)}', 'error')
         
         # Get current config
-        print(f"Getting config for user {session['user_id']}")  # Debug log
-        config, error = async_to_sync(get_user_config)(session['user_id'])
+        logger.debug("Getting config for user %s", session['user_id'])
+        config, error = await asyncio.to_thread(config_provider.get_user_dict, session['user_id'])
         if error:
-            print(f"Error loading config: {error}")  # Debug log
+            logger.warning("Error loading config: %s", error)
             flash(f'Error loading configuration: {error}', 'error')
             config = {
                 'model_name': 'gpt-3.5-turbo',
@@ -238,6 +808,13 @@ def configure():
                 'chunk_size': 2000,
                 'chunk_overlap': 100,
                 'max_chunks': 10,
+                'chunk_selection': 'salient',
+                'title_token_budget': 400,
+                'post_token_budget': 1500,
+                'generation_mode': 'standard',
+                'map_reduce_max_chunks': 200,
+                'posts_per_thread': 1,
+                'post_max_chars': 280,
                 'prompts': {
                     'title': 'Summarize the following content into a thread title that would grab attention on X (formerly Twitter): {content}',
                     'thread': 'Create a single engaging thread post from this content. Format it as a thread with line breaks between key points, use emojis where appropriate, and make it conversational: {content}'
@@ -246,11 +823,86 @@ def configure():
         
         return render_template('config.html', config=config)
     except Exception as e:
-        print(f"Unexpected error in configure route: {str(e)}")  # Debug log
+        logger.exception("Unexpected error in configure route")
         flash('An unexpected error occurred. Please try again.', 'error')
         return render_template('config.html', config={})
 
+def _warm_up_steps():
+    def load_pipeline():
+        import agents  # noqa: F401  LangChain text splitters, NumPy, the chain wrappers
+        import pypdf  # noqa: F401
+
+    def create_llm_client():
+        from config import get_config
+        from llm_clients import llm_registry
+        from selection import count_tokens
+        config = get_config()
+        llm_registry.get_chain(config)
+        # Loads (and on first run downloads) the model's tokenizer
+        count_tokens("warm-up", config.model_name)
+
+    return [
+        ("pipeline", load_pipeline),
+        ("llm_client", create_llm_client),
+        ("supabase", supabase_client.connect),
+    ]
+
+def _page_version(app):
+    """Short hash of the templates a thread page is built from, and of ``APP_VERSION`` if set."""
+    digest = hashlib.sha256(os.getenv("APP_VERSION", "").encode("utf-8"))
+    for name in ('base.html', 'thread.html'):
+        source, _, _ = app.jinja_loader.get_source(app.jinja_env, name)
+        digest.update(source.encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+def create_app(warm_up: Optional[bool] = None) -> Flask:
+    """Create the Flask app.
+
+    Heavy modules (LangChain, the OpenAI client, PyPDF) and the Supabase
+    client are loaded on first use. With ``warm_up`` (default: the
+    ``APP_WARM_UP`` environment variable, on unless "0") they are loaded on
+    a background thread instead, and ``/ready`` answers 200 once that has
+    finished. Under a pre-forking server, create the app in each worker so
+    the warm-up thread runs where requests are served.
+
+    Call it only in serving processes: it migrates the database and starts
+    the write-behind flusher. Entry modules must not call it at import time
+    in spawned children such as the batch parse workers (see ``main.py``).
+    """
+    app = Flask(__name__)
+    app.secret_key = os.getenv("FLASK_SECRET_KEY", "your-secret-key-here")
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///threads.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['HISTORY_PAGE_SIZE'] = 20
+    app.config['HISTORY_MAX_PAGE_SIZE'] = 100
+    app.config['SEARCH_PAGE_SIZE'] = 10
+    app.config['BATCH_MAX_FILES'] = int(os.getenv("BATCH_MAX_FILES", 50))
+    app.config['BATCH_MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200MB per batch request
+    app.config['BATCH_PARSE_WORKERS'] = int(os.getenv("BATCH_PARSE_WORKERS", os.cpu_count() or 2))
+    app.config['BATCH_LLM_CONCURRENCY'] = int(os.getenv("BATCH_LLM_CONCURRENCY", 4))
+    # Estimated Jaccard similarity at which an upload counts as a near-duplicate of an earlier one
+    app.config['DEDUP_THRESHOLD'] = float(os.getenv("DEDUP_THRESHOLD", 0.8))
+    # Requests slower than this are logged with their stage timings; unset disables the log
+    app.config['SLOW_REQUEST_SECONDS'] = float(os.environ["SLOW_REQUEST_SECONDS"]) if os.getenv("SLOW_REQUEST_SECONDS") else None
+    # When set, /metrics requires "Authorization: Bearer <token>"
+    app.config['METRICS_TOKEN'] = os.getenv("METRICS_TOKEN")
+    
+    db.init_app(app)
+    metrics.init_app(app, slow_request_seconds=app.config['SLOW_REQUEST_SECONDS'])
+    thread_store.init_app(app)
+    app.register_blueprint(bp)
+    # Part of thread page ETags, so a deploy with changed templates invalidates browsers' copies
+    app.config['PAGE_VERSION'] = _page_version(app)
+    
+    if warm_up is None:
+        warm_up = os.getenv("APP_WARM_UP", "1") != "0"
+    app.extensions['warm_up'] = WarmUp(_warm_up_steps(), enabled=warm_up)
+    app.extensions['warm_up'].start()
+    return app
+
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
-    app.run(host="0.0.0.0", port=5000)
+    create_app().run(host="0.0.0.0", port=5000)
@@ -0,0 +1,179 @@
+"""Session validation with local JWT checks and a short-lived user cache."""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import jwt
+
+class SessionValidator:
+    """Validate Supabase access tokens without a network call where possible.
+
+    Tokens are verified locally against the project's JWT secret (HS256) or
+    a cached JWKS. When neither is configured, or the signing key cannot be
+    resolved, the ``remote_validator`` (e.g. Supabase ``get_user``) is used.
+    Validated users are cached for ``cache_ttl`` seconds, never beyond the
+    token's own expiry, and tokens revoked on logout are rejected until
+    they expire.
+    """
+
+    def __init__(
+        self,
+        remote_validator: Callable[[str], Tuple[Any, Optional[str]]],
+        jwt_secret: Optional[str] = None,
+        jwks_url: Optional[str] = None,
+        audience: str = "authenticated",
+        cache_ttl: float = 60,
+        max_entries: int = 10000
+    ):
+        self.remote_validator = remote_validator
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True) if jwks_url else None
+        self._cache: Dict[str, Tuple[Any, float]] = {}
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "local_validations": 0,
+            "remote_validations": 0,
+            "failures": 0,
+        }
+        self._latency_total = 0.0
+
+    @staticmethod
+    def _token_key(access_token: str) -> str:
+        return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+    def validate(self, access_token: str) -> Tuple[Any, Optional[str]]:
+        """Return ``(user, error)`` for an access token."""
+        key = self._token_key(access_token)
+        now = time.time()
+        cached = self._lookup(key, now)
+        if cached is not None:
+            return cached
+        return self._validate_miss(access_token, key, now)
+
+    async def avalidate(self, access_token: str) -> Tuple[Any, Optional[str]]:
+        """Async ``validate``: cache hits return inline, misses run in a worker thread."""
+        key = self._token_key(access_token)
+        now = time.time()
+        cached = self._lookup(key, now)
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(self._validate_miss, access_token, key, now)
+
+    def _lookup(self, key: str, now: float) -> Optional[Tuple[Any, Optional[str]]]:
+        """Return ``(user, error)`` for a cached or revoked token, None on a miss."""
+        with self._lock:
+            if key in self._revoked:
+                self._counters["failures"] += 1
+                return None, "Session has been revoked"
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] > now:
+                self._counters["hits"] += 1
+                return entry[0], None
+            self._counters["misses"] += 1
+        return None
+
+    def _validate_miss(self, access_token: str, key: str, now: float) -> Tuple[Any, Optional[str]]:
+        start = time.perf_counter()
+        user, error, expires_at = self._validate_uncached(access_token, now)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._latency_total += elapsed
+            if error or not user:
+                self._counters["failures"] += 1
+                self._cache.pop(key, None)
+            else:
+                if len(self._cache) >= self.max_entries:
+                    self._evict_expired(now)
+                self._cache[key] = (user, min(now + self.cache_ttl, expires_at))
+        return user, error
+
+    def _validate_uncached(self, access_token: str, now: float) -> Tuple[Any, Optional[str], float]:
+        try:
+            claims = self._decode_locally(access_token)
+        except jwt.ExpiredSignatureError:
+            return None, "Session expired", now
+        except jwt.InvalidTokenError as e:
+            return None, f"Invalid session token: {e}", now
+
+        if claims is not None:
+            with self._lock:
+                self._counters["local_validations"] += 1
+            user = {"id": claims.get("sub"), "email": claims.get("email"), "role": claims.get("role")}
+            return user, None, float(claims.get("exp", now + self.cache_ttl))
+
+        with self._lock:
+            self._counters["remote_validations"] += 1
+        user, error = self.remote_validator(access_token)
+        try:
+            expires_at = float(jwt.decode(access_token, options={"verify_signature": False}).get("exp", now + self.cache_ttl))
+        except jwt.InvalidTokenError:
+            expires_at = now + self.cache_ttl
+        return user, error, expires_at
+
+    def _decode_locally(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """Verify the token locally; None means it has to be checked remotely."""
+        if self.jwt_secret:
+            return jwt.decode(access_token, self.jwt_secret, algorithms=["HS256"], audience=self.audience)
+        if self._jwks_client is not None:
+            try:
+                signing_key = self._jwks_client.get_signing_key_from_jwt(access_token)
+            except jwt.PyJWKClientError:
+                return None
+            return jwt.decode(
+                access_token,
+                signing_key.key,
+                algorithms=["RS256", "ES256"],
+                audience=self.audience
+            )
+        return None
+
+    def revoke(self, access_token: str):
+        """Forget a token and reject it until it expires (used on logout)."""
+        key = self._token_key(access_token)
+        try:
+            expires_at = float(jwt.decode(access_token, options={"verify_signature": False}).get("exp", 0))
+        except jwt.InvalidTokenError:
+            expires_at = 0
+        now = time.time()
+        with self._lock:
+            self._cache.pop(key, None)
+            if expires_at > now:
+                self._revoked[key] = expires_at
+            self._revoked = {k: exp for k, exp in self._revoked.items() if exp > now}
+
+    def _evict_expired(self, now: float):
+        # Caller holds the lock
+        self._cache = {k: entry for k, entry in self._cache.items() if entry[1] > now}
+        while len(self._cache) >= self.max_entries:
+            self._cache.pop(next(iter(self._cache)))
+
+    def stats(self) -> Dict[str, float]:
+        """Return cache and validation counters."""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            validations = self._counters["misses"]
+            return {
+                **self._counters,
+                "cached_sessions": len(self._cache),
+                "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+                "avg_validation_ms": self._latency_total * 1000 / validations if validations else 0.0,
+            }
+
+def create_session_validator(remote_validator: Callable[[str], Tuple[Any, Optional[str]]]) -> SessionValidator:
+    """Create a validator configured from the environment."""
+    return SessionValidator(
+        remote_validator,
+        jwt_secret=os.getenv("SUPABASE_JWT_SECRET"),
+        jwks_url=os.getenv("SUPABASE_JWKS_URL"),
+        cache_ttl=float(os.getenv("AUTH_CACHE_TTL", 60))
+    )
@@ -0,0 +1 @@
+"""Offline benchmarks for the document-to-thread pipeline."""
@@ -0,0 +1,121 @@
+"""Near-duplicate lookup latency and accuracy over a large document index.
+
+Indexes ``--docs`` synthetic documents in an in-memory SQLite database
+with the same tables the local store uses, all owned by ``--users``
+users (one by default, so every lookup searches the whole index). Then:
+
+- ``near-duplicate`` looks up indexed documents with ``--edit-rate`` of
+  their words replaced; each should find its original
+- ``unrelated`` looks up fresh documents; none should match
+
+Lookup times cover ``find_similar`` only; fingerprinting an upload is
+timed separately. The run exits with status 1 when the p99 lookup is
+over ``--budget-ms``.
+
+    python -m benchmarks.bench_dedup --docs 100000 --budget-ms 1
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+import uuid
+
+from sqlalchemy import create_engine
+
+import dedup
+from benchmarks.corpus import make_vocabulary, zipf_sampler
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def make_document(words, chunks: int, words_per_chunk: int) -> list:
+    return [" ".join(words(words_per_chunk)) for _ in range(chunks)]
+
+def edit(rng: random.Random, words, chunks: list, rate: float) -> list:
+    """Replace about ``rate`` of the words, in runs of five, in one chunk out of three."""
+    edited = []
+    for position, chunk in enumerate(chunks):
+        tokens = chunk.split()
+        if position % 3 == 0:
+            for _ in range(int(len(tokens) * rate * 3 / 5)):
+                start = rng.randrange(len(tokens))
+                tokens[start:start + 5] = words(5)
+        edited.append(" ".join(tokens))
+    return edited
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--chunks", type=int, default=4, help="chunks per document")
+    parser.add_argument("--words", type=int, default=150, help="words per chunk")
+    parser.add_argument("--queries", type=int, default=1000, help="lookups of each kind")
+    parser.add_argument("--edit-rate", type=float, default=0.02, help="share of words replaced in near-duplicates")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--budget-ms", type=float, default=1.0, help="allowed p99 lookup time")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = zipf_sampler(make_vocabulary())
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    engine = create_engine("sqlite://")
+    samples = {}
+
+    fingerprint_timings = []
+    with engine.begin() as conn:
+        dedup.create_index(conn)
+        start = time.perf_counter()
+        for n in range(args.docs):
+            chunks = make_document(words, args.chunks, args.words)
+            began = time.perf_counter()
+            fingerprint = dedup.fingerprint(chunks)
+            fingerprint_timings.append(time.perf_counter() - began)
+            thread_id = str(uuid.uuid4())
+            user_id = users[n % len(users)]
+            dedup.index_document(conn, user_id, thread_id, fingerprint)
+            if len(samples) < args.queries and rng.random() < args.queries * 2 / args.docs:
+                samples[thread_id] = (user_id, chunks)
+        build = time.perf_counter() - start
+    print(f"indexed {args.docs} documents in {build:.1f}s ({args.docs / build:.0f} docs/s)")
+    print(f"fingerprint: p50 {statistics.median(fingerprint_timings) * 1000:.2f} ms, "
+          f"p99 {percentile(fingerprint_timings, 99) * 1000:.2f} ms "
+          f"({args.chunks} chunks of {args.words} words)")
+
+    queries = [
+        (user_id, thread_id, dedup.fingerprint(edit(rng, words, chunks, args.edit_rate)))
+        for thread_id, (user_id, chunks) in samples.items()
+    ]
+    unrelated = [
+        (rng.choice(users), None, dedup.fingerprint(make_document(words, args.chunks, args.words)))
+        for _ in range(args.queries)
+    ]
+
+    worst = 0.0
+    print(f"\n{'lookup':<15} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'found':>7} {'wrong':>6} {'changed':>8}")
+    with engine.connect() as conn:
+        for name, cases in (("near-duplicate", queries), ("unrelated", unrelated)):
+            timings, found, wrong, changed = [], 0, 0, []
+            for user_id, expected, fingerprint in cases:
+                start = time.perf_counter()
+                match = dedup.find_similar(conn, user_id, fingerprint, args.threshold)
+                timings.append(time.perf_counter() - start)
+                if match is None:
+                    continue
+                found += 1
+                wrong += match.thread_id != expected
+                changed.append(len(match.changed_chunks))
+            p99 = percentile(timings, 99)
+            worst = max(worst, p99)
+            print(f"{name:<15} {len(cases):>5} {statistics.median(timings) * 1000:>8.3f} "
+                  f"{percentile(timings, 95) * 1000:>8.3f} {p99 * 1000:>8.3f} {found:>7} {wrong:>6} "
+                  f"{statistics.fmean(changed) if changed else 0:>8.2f}")
+
+    if worst * 1000 > args.budget_ms:
+        print(f"\np99 lookup took {worst * 1000:.3f} ms, over the {args.budget_ms:g} ms budget")
+        sys.exit(1)
+    print(f"\np99 lookup within the {args.budget_ms:g} ms budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare eager and lazy document ingestion on large synthetic PDFs.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ingestion --pages 50 300
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from agents import process_document
+from benchmarks.corpus import make_pdf
+from config import get_config
+
+def eager_ingest(path: str, config) -> str:
+    """The previous implementation: load and split everything, then truncate."""
+    documents = PyPDFLoader(path).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap)
+    splits = splitter.split_documents(documents)
+    return "\n".join(doc.page_content for doc in splits[:config.max_chunks])
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 300])
+    args = parser.parse_args()
+    config = get_config()
+
+    print(f"{'pages':>6} {'mode':>6} {'seconds':>9} {'peak MiB':>9} {'parsed':>7} {'text KiB':>9}")
+    for pages in args.pages:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(make_pdf(pages))
+            path = f.name
+        try:
+            eager, seconds, peak = measure(eager_ingest, path, config)
+            print(f"{pages:>6} {'eager':>6} {seconds:>9.3f} {peak / 2**20:>9.1f} {pages:>7} {'-':>9}")
+
+            lazy, seconds, peak = measure(process_document, path)
+            stats = lazy.stats
+            print(f"{pages:>6} {'lazy':>6} {seconds:>9.3f} {peak / 2**20:>9.1f} "
+                  f"{stats.pages_parsed:>7} {stats.bytes_read / 1024:>9.1f}")
+            assert lazy.text() == eager, "lazy ingestion changed the extracted content"
+        finally:
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
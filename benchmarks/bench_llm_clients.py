@@ -0,0 +1,55 @@
+"""Per-request overhead of fresh ChatOpenAI clients vs. the pooled registry.
+
+Runs against a local OpenAI-compatible mock server, so the numbers reflect
+client construction and connection setup rather than model latency.
+
+    python -m benchmarks.bench_llm_clients --requests 200
+"""
+import argparse
+import os
+import time
+
+from benchmarks.mock_openai import MockOpenAIServer
+from config import AIConfig
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with MockOpenAIServer() as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+        # Imported after the environment points at the mock server
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import PromptTemplate
+        from langchain_openai import ChatOpenAI
+        from llm_clients import LLMClientRegistry, get_prompt
+
+        config = AIConfig()
+        prompt = "Summarize: {content}"
+
+        def fresh():
+            llm = ChatOpenAI(model_name=config.model_name, temperature=config.temperature, max_tokens=config.max_tokens)
+            chain = PromptTemplate.from_template(prompt) | llm | StrOutputParser()
+            return chain.invoke({"content": "hello"})
+
+        registry = LLMClientRegistry()
+
+        def pooled():
+            return registry.get_chain(config).invoke(get_prompt(prompt).format(content="hello"))
+
+        print(f"{'mode':>7} {'requests':>9} {'ms/request':>11} {'connections':>12}")
+        for name, fn in (("fresh", fresh), ("pooled", pooled)):
+            before = server.connections
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                fn()
+            elapsed = time.perf_counter() - start
+            print(f"{name:>7} {args.requests:>9} {elapsed * 1000 / args.requests:>11.2f} "
+                  f"{server.connections - before:>12}")
+        registry.close()
+
+if __name__ == "__main__":
+    main()
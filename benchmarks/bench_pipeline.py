@@ -0,0 +1,235 @@
+"""End-to-end benchmark of the document-to-thread pipeline, fully offline.
+
+Runs process_document, create_thread and the /upload, /thread/<id> and
+/thread/<id>/export routes (through the Flask test client, plain and with
+If-None-Match) on synthetic TXT and PDF corpora. The LLM is a deterministic fake with configurable
+latency and Supabase is an in-memory stand-in. Reports throughput,
+p50/p95/p99 latency and peak RSS, and can compare against a saved baseline:
+
+    python -m benchmarks.bench_pipeline --save-baseline baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json --threshold 0.2
+
+The run exits with status 1 when any metric regresses past the threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import make_pdf_of_size, make_text
+from benchmarks.fakes import install_fake_llm, install_fake_supabase
+
+SIZE_SUFFIXES = {"K": 1024, "M": 1024 ** 2}
+
+def parse_size(value: str) -> int:
+    suffix = value[-1].upper()
+    if suffix in SIZE_SUFFIXES:
+        return int(float(value[:-1]) * SIZE_SUFFIXES[suffix])
+    return int(value)
+
+def format_size(size: int) -> str:
+    for suffix, factor in sorted(SIZE_SUFFIXES.items(), key=lambda item: -item[1]):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{suffix}"
+    return str(size)
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+def run_case(fn, iterations: int, max_seconds: float):
+    """Call ``fn`` up to ``iterations`` times (at least once) within ``max_seconds``."""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < iterations:
+        call_started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - call_started)
+        if time.perf_counter() - started > max_seconds:
+            break
+    return timings
+
+def summarize(timings, work: float, unit: str) -> dict:
+    return {
+        "n": len(timings),
+        "p50": percentile(timings, 50),
+        "p95": percentile(timings, 95),
+        "p99": percentile(timings, 99),
+        "throughput": work * len(timings) / sum(timings),
+        "unit": unit,
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+def write_corpus(directory: str, size: int, fmt: str) -> str:
+    path = os.path.join(directory, f"corpus_{format_size(size)}.{fmt}")
+    if fmt == "pdf":
+        with open(path, "wb") as f:
+            f.write(make_pdf_of_size(size))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(make_text(size))
+    return path
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return a description of every metric worse than baseline by more than ``threshold``."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ("p50", "p95", "peak_rss_mib"):
+            if current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {previous[metric]:.4g} -> {current[metric]:.4g}")
+        if current["throughput"] < previous["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name} throughput: {previous['throughput']:.4g} -> {current['throughput']:.4g} {current['unit']}"
+            )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["1K", "100K", "1M", "10M", "50M"])
+    parser.add_argument("--formats", nargs="+", choices=["txt", "pdf"], default=["txt", "pdf"])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=20, help="time budget per case")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--supabase-latency", type=float, default=0.01, help="seconds per fake Supabase call")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", help="write these results as a baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    # Keep the app's database and response cache away from the real ones
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'threads.db')}"
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.db")
+    os.environ.pop("SUPABASE_JWT_SECRET", None)
+    os.environ.pop("SUPABASE_JWKS_URL", None)
+    backend = install_fake_supabase(args.supabase_latency)
+
+    from agents import create_thread, process_document
+    from app import create_app, job_queue
+    from config import AIConfig
+    from store import thread_store
+
+    app = create_app(warm_up=False)
+    install_fake_llm(args.llm_latency)
+    config = AIConfig()
+    user_id = "00000000-0000-4000-8000-000000000001"
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["access_token"] = backend.token_for(user_id)
+        session["user_id"] = user_id
+
+    results = {}
+
+    def record(name, timings, work, unit):
+        results[name] = summarize(timings, work, unit)
+        row = results[name]
+        print(f"{name:<28} {row['n']:>4} {row['p50'] * 1000:>9.1f} {row['p95'] * 1000:>9.1f} "
+              f"{row['p99'] * 1000:>9.1f} {row['throughput']:>10.2f} {unit:<10} {row['peak_rss_mib']:>8.1f}")
+
+    def upload(path):
+        with open(path, "rb") as f:
+            response = client.post(
+                "/upload",
+                data={"file": (f, os.path.basename(path)), "no_cache": "1", "duplicates": "regenerate"},
+                content_type="multipart/form-data"
+            )
+        if response.status_code != 202:
+            raise RuntimeError(f"upload failed: {response.status_code} {response.get_data(as_text=True)}")
+        job_id = response.get_json()["job_id"]
+        while True:
+            job = client.get(f"/jobs/{job_id}/result")
+            if job.status_code != 202:
+                break
+            time.sleep(0.002)
+        body = job.get_json()
+        if not body.get("success"):
+            raise RuntimeError(f"job failed: {body}")
+        return body["thread_id"]
+
+    print(f"{'case':<28} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'throughput':>10} {'unit':<10} {'RSS MiB':>8}")
+    try:
+        for fmt in args.formats:
+            for size in map(parse_size, args.sizes):
+                path = write_corpus(workdir, size, fmt)
+                label = f"{fmt}/{format_size(size)}"
+                mib = os.path.getsize(path) / 2 ** 20
+
+                timings = run_case(lambda: process_document(path, config=config), args.iterations, args.max_seconds)
+                record(f"process_document/{label}", timings, mib, "MiB/s")
+
+                document = process_document(path, config=config)
+                timings = run_case(lambda: create_thread(document, use_cache=False, config=config),
+                                   args.iterations, args.max_seconds)
+                record(f"create_thread/{label}", timings, 1, "threads/s")
+
+                if os.path.getsize(path) > app.config["MAX_CONTENT_LENGTH"]:
+                    print(f"{'upload/' + label:<28} skipped: larger than MAX_CONTENT_LENGTH")
+                    os.remove(path)
+                    continue
+
+                thread_ids = []
+                timings = run_case(lambda: thread_ids.append(upload(path)), args.iterations, args.max_seconds)
+                record(f"upload/{label}", timings, 1, "uploads/s")
+                os.remove(path)
+
+                for route in ("view", "export"):
+                    suffix = "/export" if route == "export" else ""
+                    urls = iter(thread_ids * (args.iterations * 4 // len(thread_ids) + 1))
+
+                    def fetch():
+                        response = client.get(f"/thread/{next(urls)}{suffix}")
+                        if response.status_code != 200:
+                            raise RuntimeError(f"{route} failed: {response.status_code}")
+                    timings = run_case(fetch, args.iterations * 4, args.max_seconds)
+                    record(f"{route}/{label}", timings, 1, "req/s")
+
+                    # Repeat views of an unchanged thread revalidate against its ETag
+                    etags = {thread_id: client.get(f"/thread/{thread_id}{suffix}").headers["ETag"]
+                             for thread_id in thread_ids}
+
+                    ids = itertools.cycle(thread_ids)
+
+                    def revalidate():
+                        thread_id = next(ids)
+                        response = client.get(f"/thread/{thread_id}{suffix}",
+                                              headers={"If-None-Match": etags[thread_id]})
+                        if response.status_code != 304:
+                            raise RuntimeError(f"{route} revalidation failed: {response.status_code}")
+                    timings = run_case(revalidate, args.iterations * 4, args.max_seconds)
+                    record(f"{route}-304/{label}", timings, 1, "req/s")
+    finally:
+        job_queue.shutdown()
+        thread_store.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nno regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Latency and 429s under a provider rate limit, with and without the scheduler.
+
+One heavy user pushes a batch of ``--heavy-calls`` through ``abatch``
+while ``--light-users`` interactive users each make a call every
+``--think`` seconds. The fake provider admits ``--provider-rps`` requests
+per second and randomly rejects ``--error-rate`` of the rest with 429s.
+
+``retry only`` wraps the chain with unlimited buckets, so calls still
+retry with backoff and honour ``retry-after`` but nothing holds them back
+beforehand. ``scheduled`` also caps the rate just under the provider's and
+queues calls by priority, round-robin across users.
+
+    python -m benchmarks.bench_rate_limit --heavy-calls 300 --light-users 4 --provider-rps 40
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_core.output_parsers import StrOutputParser
+
+from benchmarks.fakes import RateLimitedChatModel
+from config import AIConfig
+from llm_clients import ScheduledRunnable
+import rate_limit
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+async def run(args, scheduler: rate_limit.RateLimitScheduler):
+    config = AIConfig()
+    model = RateLimitedChatModel(
+        latency=args.latency, requests_per_second=args.provider_rps, error_rate=args.error_rate, reply_lines=1
+    )
+    chain = ScheduledRunnable(
+        model | StrOutputParser(), scheduler, config.model_name, max_tokens=200, timeout=config.request_timeout
+    )
+    light_latencies, failures = [], 0
+
+    async def heavy():
+        rate_limit.set_caller("heavy", "batch")
+        started = time.perf_counter()
+        outputs = await chain.abatch(
+            [f"batch prompt {i}" for i in range(args.heavy_calls)],
+            config={"max_concurrency": args.heavy_concurrency},
+            return_exceptions=True
+        )
+        return time.perf_counter() - started, sum(isinstance(output, Exception) for output in outputs)
+
+    async def light(user: int):
+        nonlocal failures
+        rate_limit.set_caller(f"light-{user}", "interactive")
+        for call in range(args.light_calls):
+            await asyncio.sleep(args.think)
+            started = time.perf_counter()
+            try:
+                await chain.ainvoke(f"user {user} prompt {call}")
+                light_latencies.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+
+    (heavy_seconds, heavy_failures), *_ = await asyncio.gather(heavy(), *(light(user) for user in range(args.light_users)))
+    return {
+        "heavy_seconds": heavy_seconds,
+        "light_p50": percentile(light_latencies, 0.5),
+        "light_p95": percentile(light_latencies, 0.95),
+        "light_mean": statistics.fmean(light_latencies) if light_latencies else 0.0,
+        "rejected": model.rejected,
+        "failed": heavy_failures + failures,
+        **scheduler.stats(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--heavy-calls", type=int, default=300)
+    parser.add_argument("--heavy-concurrency", type=int, default=32)
+    parser.add_argument("--light-users", type=int, default=4)
+    parser.add_argument("--light-calls", type=int, default=10)
+    parser.add_argument("--think", type=float, default=0.3, help="seconds between a light user's calls")
+    parser.add_argument("--provider-rps", type=float, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of admitted calls failing with 429")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model seconds per call")
+    args = parser.parse_args()
+
+    modes = (
+        ("retry only", lambda: rate_limit.RateLimitScheduler(max_retries=6, backoff_base=0.25, backoff_max=4)),
+        ("scheduled", lambda: rate_limit.RateLimitScheduler(
+            # A little under the provider's rate, with the provider's one second of burst
+            requests_per_minute=args.provider_rps * 60 * 0.95, burst_seconds=1,
+            max_retries=6, backoff_base=0.25, backoff_max=4
+        )),
+    )
+    print(f"{'mode':>10} {'heavy s':>8} {'light p50 ms':>13} {'light p95 ms':>13} "
+          f"{'429s':>5} {'retries':>8} {'throttled':>10} {'failed':>7}")
+    for name, make_scheduler in modes:
+        result = asyncio.run(run(args, make_scheduler()))
+        print(f"{name:>10} {result['heavy_seconds']:>8.2f} {result['light_p50'] * 1000:>13.1f} "
+              f"{result['light_p95'] * 1000:>13.1f} {result['rejected']:>5} {result['retries']:>8} "
+              f"{result['throttled']:>10} {result['failed']:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Full-text search latency over a large synthetic thread index.
+
+Builds an in-memory FTS5 index with the same schema the local store uses,
+then times ranked searches and incremental index updates.
+
+    python -m benchmarks.bench_search --threads 100000
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+
+from sqlalchemy import create_engine
+
+import search
+from benchmarks.corpus import make_vocabulary, zipf_sampler
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = make_vocabulary()
+    words = zipf_sampler(vocabulary)
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    engine = create_engine("sqlite://")
+
+    with engine.begin() as conn:
+        search.create_index(conn)
+        start = time.perf_counter()
+        for rowid in range(1, args.threads + 1):
+            search.index_thread(
+                conn, rowid, str(uuid.uuid4()), rng.choice(users),
+                " ".join(words(6)),
+                [" ".join(words(40)) for _ in range(3)],
+                None
+            )
+        build = time.perf_counter() - start
+    print(f"indexed {args.threads} threads in {build:.1f}s ({args.threads / build:.0f} threads/s)")
+
+    with engine.connect() as conn:
+        timings = []
+        for _ in range(args.queries):
+            # Mix of common and rarer terms
+            query = " ".join(rng.choice(vocabulary[:rng.choice((50, 500, 5000))]) for _ in range(2))
+            start = time.perf_counter()
+            search.search_threads(conn, rng.choice(users), query, page=rng.randint(1, 3))
+            timings.append(time.perf_counter() - start)
+        print(f"search: p50 {statistics.median(timings) * 1000:.2f} ms, "
+              f"p95 {percentile(timings, 95) * 1000:.2f} ms, p99 {percentile(timings, 99) * 1000:.2f} ms")
+
+    with engine.begin() as conn:
+        start = time.perf_counter()
+        for rowid in range(args.threads + 1, args.threads + 1001):
+            search.index_thread(conn, rowid, str(uuid.uuid4()), users[0], "new title", [" ".join(words(80))], None)
+        for rowid in range(args.threads + 1, args.threads + 1001):
+            search.remove_thread(conn, rowid)
+        per_update = (time.perf_counter() - start) / 2000
+    print(f"incremental update: {per_update * 1000:.3f} ms per insert/delete")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Prompt tokens and content quality of chunk selection strategies.
+
+Builds documents that open with a table of contents and a legal notice,
+repeat a boilerplate footer after every section, and only then get to the
+substance. Compares, per request (title + post prompt content):
+
+- ``first-n``: the previous fixed slices, 2 chunks for the title, 6 for the post
+- ``leading``: chunks in document order packed into the token budgets
+- ``salient``: the most representative chunks first, near-duplicates dropped
+
+``body %`` is the share of prompt tokens taken from section text rather
+than front matter or footers; ``sections`` counts the distinct sections
+the post prompt draws on.
+
+    python -m benchmarks.bench_selection --sections 8 16 --max-chunks 10 40
+"""
+import argparse
+import random
+import re
+import time
+from dataclasses import replace
+
+from agents import ChunkedDocument, select_content
+from benchmarks.corpus import WORDS, make_vocabulary
+from config import AIConfig
+from selection import count_tokens
+
+LEGAL = (
+    "Copyright notice. All rights reserved. No part of this publication may be reproduced, "
+    "distributed or transmitted in any form or by any means without the prior written permission "
+    "of the publisher, except for brief quotations embodied in critical reviews. "
+)
+FOOTER = "Confidential and proprietary. For internal distribution only. Page intentionally formatted."
+
+def make_document(sections: int, paragraphs: int = 6, seed: int = 0):
+    """Return ``(text, section_markers)``; each section's body contains its marker word."""
+    rng = random.Random(seed)
+    topics = make_vocabulary(400, seed)
+    markers = [f"sectionmarker{number}" for number in range(sections)]
+    parts = ["Table of Contents"]
+    parts += [f"{number + 1}. {topics[number].title()} {topics[number + 1]} .......... {number * 7 + 3}"
+              for number in range(sections)]
+    parts.append(LEGAL * 6)
+    for number, marker in enumerate(markers):
+        # Every section shares the document's theme plus a few topic words of its own
+        vocabulary = WORDS + topics[number * 5:number * 5 + 5] + [marker]
+        parts.append(f"{number + 1}. {topics[number].title()}")
+        for _ in range(paragraphs):
+            parts.append(" ".join(rng.choice(vocabulary) for _ in range(90)).capitalize() + ".")
+        parts.append(FOOTER)
+    return "\n\n".join(parts), markers
+
+def first_n(document, config):
+    return document.text(2), document.text(6)
+
+def budgeted(document, config):
+    return (select_content(document, config, config.title_token_budget),
+            select_content(document, config, config.post_token_budget))
+
+def body_share(text: str, model_name: str) -> float:
+    boilerplate = re.sub(r"sectionmarker\d+", "", text)
+    # Body paragraphs are the lines holding topic text, not the ToC, notice or footer
+    body = "\n".join(
+        line for line in boilerplate.splitlines()
+        if line and not line.startswith(("Copyright", "Confidential", "Table of Contents"))
+        and "......" not in line
+    )
+    total = count_tokens(text, model_name)
+    return count_tokens(body, model_name) / total if total else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, nargs="+", default=[8, 16])
+    parser.add_argument("--max-chunks", type=int, nargs="+", default=[10, 40])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    base = AIConfig()
+
+    print(f"{'sections':>8} {'pool':>5} {'strategy':>9} {'tokens/req':>11} {'body %':>7} {'sections':>9} {'select ms':>10}")
+    for sections in args.sections:
+        text, markers = make_document(sections)
+        for max_chunks in args.max_chunks:
+            for name, fn, selection in (
+                ("first-n", first_n, "leading"),
+                ("leading", budgeted, "leading"),
+                ("salient", budgeted, "salient"),
+            ):
+                config = replace(base, max_chunks=max_chunks, chunk_selection=selection)
+                document = ChunkedDocument.from_text(text, config)
+                started = time.perf_counter()
+                for _ in range(args.repeat):
+                    title, post = fn(document, config)
+                elapsed = (time.perf_counter() - started) / args.repeat
+                tokens = count_tokens(title, config.model_name) + count_tokens(post, config.model_name)
+                covered = sum(1 for marker in markers if marker in post)
+                print(f"{sections:>8} {max_chunks:>5} {name:>9} {tokens:>11} "
+                      f"{body_share(title + chr(10) + post, config.model_name) * 100:>6.0f}% "
+                      f"{covered:>4}/{len(markers):<4} {elapsed * 1000:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Micro-benchmark: ingestion-to-generation hand-off on multi-MB inputs.
+
+Compares the old hand-off (join every chunk into one string, then re-split
+it at 2x chunk_size to pick the title and post content) with packing the
+typed chunk list in order into the prompt token budgets. Ingestion itself is shared and not timed.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_split --sizes 1 4 16
+"""
+import argparse
+import time
+from dataclasses import replace
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from agents import ChunkedDocument, select_content
+from benchmarks.corpus import make_text
+from config import get_config
+
+def join_and_resplit(splits, config):
+    """The previous hand-off between process_document and create_thread."""
+    content = "\n".join(splits)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=config.chunk_size * 2, chunk_overlap=config.chunk_overlap)
+    chunks = text_splitter.split_text(content)
+    return chunks[0], " ".join(chunks[:3])
+
+def typed_chunks(document, config):
+    return select_content(document, config, config.title_token_budget), select_content(document, config, config.post_token_budget)
+
+def best_of(fn, *args, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16], help="input sizes in MB")
+    args = parser.parse_args()
+
+    print(f"{'MB':>4} {'chunks':>7} {'resplit ms':>11} {'typed ms':>9} {'speedup':>9}")
+    for size in args.sizes:
+        text = make_text(size * 2**20)
+        # Keep every chunk so the hand-off carries the whole input
+        config = replace(get_config(), max_chunks=len(text), chunk_selection="leading")
+        document = ChunkedDocument.from_text(text, config)
+        splits = [chunk.text for chunk in document.chunks]
+
+        old = best_of(join_and_resplit, splits, config)
+        new = best_of(typed_chunks, document, config)
+        print(f"{size:>4} {len(splits):>7} {old * 1000:>11.2f} {new * 1000:>9.3f} {old / new:>8.0f}x")
+
+if __name__ == "__main__":
+    main()
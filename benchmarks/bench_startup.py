@@ -0,0 +1,124 @@
+"""Worker cold-start time: importing ``app`` and creating it, checked against a budget.
+
+Each run is a fresh interpreter, so nothing is cached between runs. Rows:
+
+- ``create_app``: ``import app`` plus ``create_app(warm_up=False)``
+- ``first request``: the above plus one GET /login
+- ``ready``: ``create_app()`` with warm-up, until ``/ready`` would answer 200
+- ``eager``: ``create_app`` plus everything the warm-up loads, i.e. what
+  every worker paid at startup before these modules became lazy
+
+The slowest imports of the ``create_app`` case, from ``-X importtime``, are
+listed below the table.
+The run exits with status 1 when the median ``create_app`` time is over
+``--budget-ms``.
+
+    python -m benchmarks.bench_startup --runs 5 --budget-ms 1000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each snippet prints the elapsed seconds on its last line
+CASES = {
+    "create_app": """
+import time; started = time.perf_counter()
+import app; app.create_app(warm_up=False)
+print(time.perf_counter() - started)
+""",
+    "first request": """
+import time; started = time.perf_counter()
+import app; client = app.create_app(warm_up=False).test_client()
+assert client.get('/login').status_code == 200
+print(time.perf_counter() - started)
+""",
+    "ready": """
+import time; started = time.perf_counter()
+import app; created = app.create_app(warm_up=True)
+created.extensions['warm_up'].wait()
+print(time.perf_counter() - started)
+""",
+    "eager": """
+import time; started = time.perf_counter()
+import app; app.create_app(warm_up=False)
+for _, step in app._warm_up_steps():
+    try:
+        step()
+    except Exception:
+        pass
+print(time.perf_counter() - started)
+""",
+}
+
+def run_case(code: str, env: dict, importtime: bool = False):
+    """Return ``(seconds, importtime stderr)`` for one fresh interpreter."""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"startup failed:\n{result.stderr[-2000:]}")
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def slowest_imports(stderr: str, top: int):
+    """Top-level imports by cumulative microseconds, from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        # Depth 0 is imported by the snippet itself, 1 by those modules
+        if depth <= 1:
+            rows.append((int(cumulative), name.strip(), depth))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000, help="allowed median create_app time")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'threads.db')}",
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+        # Clients are created, never called; nothing needs to listen here
+        "SUPABASE_URL": os.environ.get("SUPABASE_URL", "http://127.0.0.1:9"),
+        "SUPABASE_ANON_KEY": os.environ.get("SUPABASE_ANON_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-benchmark"),
+        "LOG_LEVEL": "ERROR",
+    }
+    try:
+        # Create the database once so every run measures the same work
+        run_case(CASES["create_app"], env)
+
+        medians = {}
+        print(f"{'case':<14} {'runs':>5} {'p50 ms':>9} {'min ms':>9} {'max ms':>9}")
+        for name, code in CASES.items():
+            timings = [run_case(code, env)[0] for _ in range(args.runs)]
+            medians[name] = statistics.median(timings)
+            print(f"{name:<14} {args.runs:>5} {medians[name] * 1000:>9.1f} "
+                  f"{min(timings) * 1000:>9.1f} {max(timings) * 1000:>9.1f}")
+
+        _, stderr = run_case(CASES["create_app"], env, importtime=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"\n{'cumulative ms':>13}  import")
+    for cumulative, module, depth in slowest_imports(stderr, args.top):
+        print(f"{cumulative / 1000:>13.1f}  {'  ' * depth}{module}")
+
+    budget = args.budget_ms / 1000
+    if medians["create_app"] > budget:
+        print(f"\ncreate_app took {medians['create_app'] * 1000:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+    print(f"\ncreate_app within the {args.budget_ms:.0f} ms budget")
+
+if __name__ == "__main__":
+    main()
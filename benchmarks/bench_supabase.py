@@ -0,0 +1,176 @@
+"""Throughput of the async Supabase data layer vs. the old async_to_sync bridge.
+
+Runs against a local stub PostgREST server, so the numbers reflect how many
+calls are in flight and how connections are reused rather than database work.
+
+    python -m benchmarks.bench_supabase --requests 400 --concurrency 32 --latency 0.02
+
+``bridge`` is the previous pattern: a synchronous supabase client wrapped in
+``async_to_sync`` per call, with concurrency coming only from request
+threads. ``async`` awaits ``supabase_client.get_thread`` with ``asyncio.gather``
+over the shared pooled client. Both modes open their connections in an
+untimed warm-up round, and ``connections`` counts those opened afterwards.
+
+A second table times one request that needs ``--fanout`` calls (a
+write-behind flush, say): the bridge makes them one after another, the
+async layer gathers them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+THREAD_ROW = {
+    "id": "00000000-0000-4000-8000-000000000002",
+    "user_id": "00000000-0000-4000-8000-000000000001",
+    "title": "Benchmark thread",
+    "content": ["First post", "Second post"],
+    "post_count": 2,
+    "created_at": "2024-01-01T00:00:00+00:00",
+    "updated_at": "2024-01-01T00:00:00+00:00",
+}
+
+class StubPostgREST:
+    """Answer every GET with one thread row after ``latency`` seconds.
+
+    Serves HTTP/1.1 keep-alive from an asyncio loop on its own thread, so a
+    slow stub response costs no server thread and high concurrency measures
+    the client. ``connections`` counts accepted TCP connections so callers
+    can see whether keep-alive is used.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                # .single() asks for an object rather than a one-element array
+                single = b"vnd.pgrst.object" in head
+                body = json.dumps(THREAD_ROW if single else [THREAD_ROW]).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Client hung up, or the stub is shutting down
+            pass
+        finally:
+            writer.close()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0, backlog=1024), self._loop
+        ).result()
+        return self
+
+    async def _shutdown(self):
+        self._server.close()
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32, help="calls in flight at once")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub server seconds per call")
+    parser.add_argument("--fanout", type=int, default=10, help="calls made by one request")
+    parser.add_argument("--fanout-rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with StubPostgREST(args.latency) as server:
+        os.environ["SUPABASE_URL"] = server.url
+        # Any JWT-shaped string passes the client's key check
+        os.environ["SUPABASE_ANON_KEY"] = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark"
+
+        # Imported after the environment points at the stub server
+        from asgiref.sync import async_to_sync
+        from supabase import create_client
+        import supabase_client
+
+        sync_client = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_ANON_KEY"])
+
+        async def bridged_get_thread(thread_id):
+            response = sync_client.table('threads').select('*').eq('id', thread_id).single().execute()
+            return response.data, None
+
+        def bridge(requests):
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                results = list(pool.map(
+                    lambda _: async_to_sync(bridged_get_thread)(THREAD_ROW["id"]), range(requests)
+                ))
+            return results
+
+        def async_layer(requests):
+            async def run():
+                semaphore = asyncio.Semaphore(args.concurrency)
+
+                async def one():
+                    async with semaphore:
+                        return await supabase_client.get_thread(THREAD_ROW["id"])
+                return await asyncio.gather(*(one() for _ in range(requests)))
+            return asyncio.run(run())
+
+        print(f"{'mode':>7} {'requests':>9} {'req/s':>9} {'ms/request':>11} {'connections':>12}")
+        for name, fn in (("bridge", bridge), ("async", async_layer)):
+            # Open the pool's connections first so both modes are measured warm
+            fn(args.concurrency)
+            before = server.connections
+            start = time.perf_counter()
+            results = fn(args.requests)
+            elapsed = time.perf_counter() - start
+            errors = [error for _, error in results if error]
+            if errors:
+                raise RuntimeError(f"{name}: {len(errors)} failed calls, e.g. {errors[0]}")
+            print(f"{name:>7} {args.requests:>9} {args.requests / elapsed:>9.1f} "
+                  f"{elapsed * 1000 / args.requests:>11.2f} {server.connections - before:>12}")
+
+        # One request needing several calls: the bridge can only make them in turn
+        def bridge_fanout():
+            return [async_to_sync(bridged_get_thread)(THREAD_ROW["id"]) for _ in range(args.fanout)]
+
+        def async_fanout():
+            async def run():
+                return await asyncio.gather(*(supabase_client.get_thread(THREAD_ROW["id"]) for _ in range(args.fanout)))
+            return asyncio.run(run())
+
+        print(f"\n{'mode':>7} {'calls':>9} {'ms/request':>11}")
+        for name, fn in (("bridge", bridge_fanout), ("async", async_fanout)):
+            timings = []
+            for _ in range(args.fanout_rounds):
+                start = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - start)
+            print(f"{name:>7} {args.fanout:>9} {sorted(timings)[len(timings) // 2] * 1000:>11.1f}")
+        supabase_client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Synthetic document corpora for benchmarks."""
+import random
+from itertools import accumulate
+
+WORDS = (
+    "report growth market revenue customer product team quarter strategy "
+    "data model launch platform security cost margin region pricing churn "
+    "retention pipeline forecast hiring roadmap partner feature survey"
+).split()
+
+def make_vocabulary(size: int = 5000, seed: int = 0) -> list:
+    """Pseudo-words for corpora that need a realistic vocabulary size."""
+    rng = random.Random(seed)
+    letters = "etaoinshrdlucmfwypvbgkqjxz"
+    vocabulary = set(WORDS)
+    while len(vocabulary) < size:
+        vocabulary.add("".join(rng.choice(letters[:18]) for _ in range(rng.randint(4, 9))))
+    return sorted(vocabulary)
+
+def zipf_sampler(vocabulary: list, seed: int = 0):
+    """Return ``sample(count)`` drawing words with a Zipf-like frequency distribution."""
+    rng = random.Random(seed)
+    cumulative = list(accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    return lambda count: rng.choices(vocabulary, cum_weights=cumulative, k=count)
+
+def paragraph(rng: random.Random, words: int = 80) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def make_text(size_bytes: int, seed: int = 0) -> str:
+    """Return roughly ``size_bytes`` of paragraph text."""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size_bytes:
+        text = paragraph(rng)
+        parts.append(text)
+        total += len(text) + 2
+    return "\n\n".join(parts)
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(pages: int, lines_per_page: int = 45, seed: int = 0) -> bytes:
+    """Build a minimal multi-page text PDF without external dependencies."""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = " T* ".join(f"({_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def make_pdf_of_size(size_bytes: int, seed: int = 0) -> bytes:
+    """Build a text PDF of roughly ``size_bytes``."""
+    page_bytes = len(make_pdf(2, seed=seed)) - len(make_pdf(1, seed=seed))
+    return make_pdf(max(1, round(size_bytes / page_bytes)), seed=seed)
@@ -0,0 +1,257 @@
+"""Offline stand-ins for the LLM and Supabase used by the pipeline benchmarks.
+
+``install_fake_supabase`` must run before ``app`` (or anything importing
+``supabase_client``) is imported, so that ``app`` binds to the fake functions.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+from dataclasses import asdict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import httpx
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from benchmarks.corpus import WORDS
+from config import AIConfig
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model: the reply depends only on the prompt.
+
+    Every call waits ``latency`` seconds, so concurrency shows up in timings
+    the way it would against a real API.
+    """
+
+    latency: float = 0.0
+    reply_lines: int = 6
+    words_per_line: int = 10
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-deterministic"
+
+    def _reply(self, messages) -> ChatResult:
+        prompt = messages[-1].content
+        rng = random.Random(hashlib.sha256(prompt.encode()).digest())
+        text = "\n".join(
+            " ".join(rng.choice(WORDS) for _ in range(self.words_per_line)).capitalize() + "."
+            for _ in range(self.reply_lines)
+        )
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"token_usage": usage, "model_name": self._llm_type}
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._reply(messages)
+
+class RateLimitedChatModel(FakeChatModel):
+    """FakeChatModel behind a provider-style request limit.
+
+    Admits ``requests_per_second`` with one second of burst. Calls over the
+    limit, and a random ``error_rate`` share of the rest, fail with the 429
+    ``openai.RateLimitError`` the real client raises, including a
+    ``retry-after-ms`` header. ``rejected`` counts those errors.
+    """
+
+    requests_per_second: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+    rejected: int = 0
+    _level: float = PrivateAttr(default=0.0)
+    _updated: float = PrivateAttr(default_factory=time.monotonic)
+    _rng: random.Random = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, context):
+        self._level = self.requests_per_second
+        self._rng = random.Random(self.seed)
+
+    def _admit(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.requests_per_second:
+                self._level = min(self.requests_per_second, self._level + (now - self._updated) * self.requests_per_second)
+            self._updated = now
+            if self.requests_per_second and self._level < 1:
+                wait = (1 - self._level) / self.requests_per_second
+            elif self._rng.random() < self.error_rate:
+                wait = 0.1
+            else:
+                self._level -= 1
+                return
+            self.rejected += 1
+        response = httpx.Response(
+            429,
+            headers={"retry-after-ms": str(int(wait * 1000) + 1)},
+            request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        )
+        raise openai.RateLimitError("Rate limit reached for requests", response=response, body=None)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._admit()
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._admit()
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+def install_fake_llm(latency: float = 0.0) -> FakeChatModel:
+    """Route every pooled chain from ``llm_registry`` to a FakeChatModel."""
+    from llm_clients import llm_registry
+
+    model = FakeChatModel(latency=latency)
+    chain = model | StrOutputParser()
+    llm_registry.get_chain = lambda config: chain
+    return model
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class FakeSupabase:
+    """In-memory replacement for the ``supabase_client`` functions.
+
+    Each call waits ``latency`` seconds and returns the same
+    ``(data, error)`` shapes as the real client.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.threads = {}
+        self.configs = {}
+
+    async def _wait(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    # Auth
+
+    @staticmethod
+    def token_for(user_id: str) -> str:
+        return f"token-{user_id}"
+
+    async def sign_up(self, email: str, password: str):
+        await self._wait()
+        return SimpleNamespace(id=str(uuid.uuid5(uuid.NAMESPACE_URL, email)), email=email), None
+
+    async def sign_in(self, email: str, password: str):
+        user, _ = await self.sign_up(email, password)
+        return {'user': user, 'session': SimpleNamespace(access_token=self.token_for(user.id))}, None
+
+    async def sign_out(self, session):
+        return True, None
+
+    async def get_user(self, access_token: str):
+        await self._wait()
+        if not access_token.startswith("token-"):
+            return None, "User not found"
+        return SimpleNamespace(id=access_token[len("token-"):]), None
+
+    # Threads
+
+    async def upsert_threads(self, rows: list):
+        await self._wait()
+        saved = []
+        for row in rows:
+            saved.append({**row, 'post_count': len(row['content']), 'created_at': row.get('created_at') or _now(),
+                          'updated_at': _now()})
+            self.threads[row['id']] = saved[-1]
+        return saved, None
+
+    async def get_user_threads(self, user_id: str):
+        await self._wait()
+        return [row for row in self.threads.values() if row['user_id'] == user_id], None
+
+    async def get_user_threads_page(self, user_id: str, limit: int = 20, cursor: str = None):
+        await self._wait()
+        rows = sorted(
+            (row for row in self.threads.values() if row['user_id'] == user_id),
+            key=lambda row: (row['created_at'], row['id']),
+            reverse=True
+        )
+        if cursor:
+            position = tuple(decode_cursor(cursor))
+            rows = [row for row in rows if (row['created_at'], row['id']) < position]
+        page = [{key: row[key] for key in ('id', 'title', 'created_at', 'post_count')} for row in rows[:limit]]
+        next_cursor = encode_cursor(page[-1]['created_at'], page[-1]['id']) if len(rows) > limit else None
+        return {'threads': page, 'next_cursor': next_cursor}, None
+
+    async def get_thread(self, thread_id: str):
+        await self._wait()
+        row = self.threads.get(thread_id)
+        return (row, None) if row else (None, "Thread not found")
+
+    async def get_threads(self, thread_ids: list):
+        await self._wait()
+        return [self.threads[thread_id] for thread_id in thread_ids if thread_id in self.threads], None
+
+    async def delete_thread(self, thread_id: str, user_id: str):
+        await self._wait()
+        self.threads.pop(thread_id, None)
+        return True, None
+
+    # Config
+
+    async def get_user_config(self, user_id: str):
+        await self._wait()
+        # Like the real client, a first read stores the default config
+        return self.configs.setdefault(user_id, {**asdict(AIConfig()), 'user_id': user_id}), None
+
+    async def update_user_config(self, user_id: str, config_data: dict):
+        await self._wait()
+        self.configs[user_id] = {**config_data, 'user_id': user_id}
+        return self.configs[user_id], None
+
+def encode_cursor(created_at: str, thread_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, thread_id]).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, thread_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(thread_id))
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+_EXPORTED = (
+    "sign_up", "sign_in", "sign_out", "get_user", "upsert_threads",
+    "get_user_threads", "get_user_threads_page", "get_thread", "get_threads", "delete_thread",
+    "get_user_config", "update_user_config",
+)
+
+def install_fake_supabase(latency: float = 0.0) -> FakeSupabase:
+    """Register a ``supabase_client`` module backed by a FakeSupabase."""
+    backend = FakeSupabase(latency)
+    module = types.ModuleType("supabase_client")
+    module.__doc__ = "Offline stand-in for supabase_client (benchmarks only)."
+    for name in _EXPORTED:
+        setattr(module, name, getattr(backend, name))
+    module.encode_cursor = encode_cursor
+    module.decode_cursor = decode_cursor
+    # The fake holds no loop-bound state, so a fresh loop per call is enough
+    module.run_sync = asyncio.run
+    module.connect = lambda: None
+    module.close = lambda: None
+    module.backend = backend
+    sys.modules["supabase_client"] = module
+    return backend
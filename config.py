@@ -1,11 +1,21 @@
 """Configuration settings for the AI thread generator."""
 import json
+import logging
 import os
-from typing import Dict, Optional
-from dataclasses import dataclass, asdict
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from dataclasses import dataclass, asdict, fields, replace
 
 CONFIG_FILE = "config.json"
 
+logger = logging.getLogger(__name__)
+
+GENERATION_MODES = ("standard", "map_reduce")
+CHUNK_SELECTIONS = ("salient", "leading")
+# Each post is its own LLM call; matches the limit on the config form
+MAX_POSTS_PER_THREAD = 25
+
 @dataclass
 class AIConfig:
     model_name: str = "gpt-3.5-turbo"
@@ -17,6 +27,30 @@ class AIConfig:
     chunk_overlap: int = 100
     max_chunks: int = 10
     
+    # Prompt content is packed into these token budgets: "salient" takes the
+    # chunks most representative of the document first, "leading" goes in order
+    chunk_selection: str = "salient"
+    title_token_budget: int = 400
+    post_token_budget: int = 1500
+    
+    # Seconds allowed for a single LLM call
+    request_timeout: float = 120
+    
+    # "standard" prompts on the leading chunks; "map_reduce" summarizes the
+    # whole document (up to map_reduce_max_chunks) and prompts on the summary
+    generation_mode: str = "standard"
+    map_reduce_max_chunks: int = 200
+    map_concurrency: int = 8
+    reduce_fan_in: int = 5
+    
+    # More than one post switches to outline-then-posts generation, with
+    # posts written concurrently and kept under post_max_chars
+    posts_per_thread: int = 1
+    post_concurrency: int = 4
+    post_max_chars: int = 280
+    # Shorter rewrites asked for when a post is over post_max_chars
+    post_retries: int = 2
+    
     # Prompt templates
     prompts: Dict[str, str] = None
     
@@ -27,6 +61,12 @@ class AIConfig:
                 "thread": "Create a single engaging thread post from this content. Format it as a thread with line breaks between key points, use emojis where appropriate, and make it conversational: {content}"
             }
     
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AIConfig":
+        """Build a config from a dict, ignoring unknown keys such as database columns."""
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in names and value is not None})
+    
     def validate(self):
         """Validate configuration values."""
         if self.temperature < 0 or self.temperature > 1:
@@ -39,8 +79,37 @@ class AIConfig:
             raise ValueError("Chunk overlap cannot be negative")
         if self.max_chunks < 1:
             raise ValueError("Max chunks must be positive")
+        if self.chunk_selection not in CHUNK_SELECTIONS:
+            raise ValueError(f"Chunk selection must be one of: {', '.join(CHUNK_SELECTIONS)}")
+        if self.title_token_budget < 1 or self.post_token_budget < 1:
+            raise ValueError("Token budgets must be positive")
+        if self.request_timeout <= 0:
+            raise ValueError("Request timeout must be positive")
+        if self.generation_mode not in GENERATION_MODES:
+            raise ValueError(f"Generation mode must be one of: {', '.join(GENERATION_MODES)}")
+        if self.map_reduce_max_chunks < 1:
+            raise ValueError("Map-reduce max chunks must be positive")
+        if self.map_concurrency < 1:
+            raise ValueError("Map concurrency must be positive")
+        if self.reduce_fan_in < 2:
+            raise ValueError("Reduce fan-in must be at least 2")
+        if self.posts_per_thread < 1 or self.posts_per_thread > MAX_POSTS_PER_THREAD:
+            raise ValueError(f"Posts per thread must be between 1 and {MAX_POSTS_PER_THREAD}")
+        if self.post_concurrency < 1:
+            raise ValueError("Post concurrency must be positive")
+        if self.post_max_chars < 1:
+            raise ValueError("Post character limit must be positive")
+        if self.post_retries < 0:
+            raise ValueError("Post retries cannot be negative")
         if not isinstance(self.prompts, dict) or "title" not in self.prompts or "thread" not in self.prompts:
             raise ValueError("Prompts must contain 'title' and 'thread' templates")
+    
+    @property
+    def chunk_limit(self) -> int:
+        """Number of chunks ingestion keeps for the configured generation mode."""
+        if self.generation_mode == "map_reduce":
+            return self.map_reduce_max_chunks
+        return self.max_chunks
 
 # Default configuration
 default_config = AIConfig()
@@ -51,15 +120,101 @@ def save_config(config: AIConfig):
     with open(CONFIG_FILE, 'w') as f:
         json.dump(asdict(config), f, indent=2)
 
+class ConfigProvider:
+    """Thread-safe cache for the configuration file and per-user configs.
+
+    The parsed file is reused until its mtime, inode or size changes (or
+    ``invalidate`` is called). Per-user configs come from ``user_loader``,
+    which returns ``(config_dict, error)``, and are cached for ``user_ttl``
+    seconds. Returned ``AIConfig`` objects are shared snapshots and must not
+    be mutated.
+    """
+    
+    def __init__(
+        self,
+        path: str = CONFIG_FILE,
+        user_loader: Optional[Callable[[str], Tuple[Optional[dict], Optional[str]]]] = None,
+        user_ttl: float = 60
+    ):
+        self.path = path
+        self.user_loader = user_loader
+        self.user_ttl = user_ttl
+        self._config: Optional[AIConfig] = None
+        self._signature = None
+        self._users: Dict[str, Tuple[dict, AIConfig, float]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self) -> AIConfig:
+        """Return the file configuration, reloading it only when the file changed."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return default_config
+        signature = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        
+        with self._lock:
+            if self._config is not None and signature == self._signature:
+                return self._config
+        
+        with open(self.path, 'r') as f:
+            config = AIConfig(**json.load(f))
+        config.validate()
+        
+        with self._lock:
+            self._config = config
+            self._signature = signature
+        return config
+    
+    def invalidate(self):
+        """Force the next ``get`` to re-read the file."""
+        with self._lock:
+            self._config = None
+            self._signature = None
+    
+    def get_user_dict(self, user_id: str) -> Tuple[Optional[dict], Optional[str]]:
+        """Return ``(config_dict, error)`` for a user through the TTL cache."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[2] > now:
+                return entry[0], None
+        
+        if self.user_loader is None:
+            return None, "No user configuration loader"
+        data, error = self.user_loader(user_id)
+        if error or not data:
+            return None, error or "User configuration not found"
+        
+        try:
+            config = AIConfig.from_dict(data)
+            config.validate()
+        except (TypeError, ValueError) as e:
+            # Stored before a rule was added or edited outside the app; callers fall back
+            logger.warning("Invalid stored config for user %s: %s", user_id, e)
+            return None, f"Invalid stored configuration: {e}"
+        with self._lock:
+            self._users[user_id] = (data, config, now + self.user_ttl)
+        return data, None
+    
+    def get_for_user(self, user_id: str) -> AIConfig:
+        """Return a user's config, falling back to the file config."""
+        data, error = self.get_user_dict(user_id)
+        if error:
+            return self.get()
+        with self._lock:
+            entry = self._users.get(user_id)
+        return entry[1] if entry is not None else AIConfig.from_dict(data)
+    
+    def invalidate_user(self, user_id: str):
+        """Drop a user's cached config, e.g. after it was updated."""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+config_provider = ConfigProvider()
+
 def get_config() -> AIConfig:
     """Get the current AI configuration."""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            config_dict = json.load(f)
-            config = AIConfig(**config_dict)
-            config.validate()
-            return config
-    return default_config
+    return config_provider.get()
 
 def update_config(
     model_name: Optional[str] = None,
@@ -71,7 +226,9 @@ def update_config(
     prompts: Optional[Dict[str, str]] = None
 ) -> AIConfig:
     """Update the AI configuration with new values."""
-    config = get_config()
+    # Work on a copy; the cached snapshot is shared
+    current = get_config()
+    config = replace(current, prompts=dict(current.prompts))
     
     if model_name is not None:
         config.model_name = model_name
@@ -89,4 +246,5 @@ def update_config(
         config.prompts.update(prompts)
     
     save_config(config)
+    config_provider.invalidate()
     return config
@@ -0,0 +1,207 @@
+"""Near-duplicate detection for uploaded documents with MinHash and LSH.
+
+Each document gets a MinHash signature over word shingles of its chunks,
+and a hash of every normalized chunk. Signatures are split into bands;
+each band is stored as one bucket key per user, so a lookup only reads
+the few documents that share a bucket with the new one and compares
+their signatures. The stored chunk hashes tell which chunks of the new
+upload differ from the matching document.
+"""
+import functools
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from sqlalchemy import bindparam, text
+
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+# Columns of the hash matrix computed at once, bounding memory for long documents
+_BLOCK = 8192
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+@dataclass
+class Fingerprint:
+    """MinHash signature of a document and the hashes of its chunks, in order."""
+    signature: bytes
+    chunk_hashes: List[bytes]
+
+    @property
+    def chunk_blob(self) -> bytes:
+        return b"".join(self.chunk_hashes)
+
+@dataclass
+class Match:
+    """An indexed document similar to a new upload."""
+    thread_id: str
+    similarity: float
+    # Positions of the upload's chunks that the matching document does not contain
+    changed_chunks: List[int]
+    total_chunks: int
+
+    def to_dict(self) -> dict:
+        return {
+            'duplicate_of': self.thread_id,
+            'similarity': round(self.similarity, 3),
+            'changed_chunks': self.changed_chunks,
+            'total_chunks': self.total_chunks,
+        }
+
+def _hash64(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+@functools.lru_cache(maxsize=1)
+def _permutations():
+    # NumPy loads on first fingerprint rather than at startup.
+    # Derived from a fixed seed so stored signatures stay comparable across releases.
+    import numpy as np
+    coefficients = np.frombuffer(hashlib.shake_128(b"threadsynth-minhash").digest(NUM_PERM * 16), dtype="<u8")
+    a = coefficients[:NUM_PERM] | np.uint64(1)
+    b = coefficients[NUM_PERM:]
+    return a[:, None], b[:, None]
+
+def shingle_hashes(chunk_tokens: Sequence[List[str]]):
+    """Distinct 64-bit hashes of the word shingles of every chunk; shingles do not cross chunks.
+
+    Each distinct word is hashed once; a shingle's hash is a polynomial in
+    its words' hashes, computed for all shingles at once.
+    """
+    import numpy as np
+    words = {}
+    parts = []
+    for tokens in chunk_tokens:
+        if not tokens:
+            continue
+        ids = np.fromiter((words.setdefault(token, len(words)) for token in tokens), dtype=np.int64, count=len(tokens))
+        parts.append(ids)
+    if not parts:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = np.frombuffer(b"".join(_hash64(word.encode("utf-8")) for word in words), dtype="<u8")
+    # Any odd 64-bit constant works; arithmetic wraps modulo 2**64
+    base = np.uint64(0x9E3779B97F4A7C15)
+    shingles = []
+    for ids in parts:
+        hashes = word_hashes[ids]
+        width = min(SHINGLE_WORDS, len(hashes))
+        combined = np.zeros(len(hashes) - width + 1, dtype=np.uint64)
+        for offset in range(width):
+            combined = combined * base + hashes[offset:offset + len(combined)]
+        shingles.append(combined)
+    return np.unique(np.concatenate(shingles))
+
+def minhash(hashes) -> bytes:
+    """Signature of non-empty shingle hashes: per permutation, the minimum multiply-shift hash."""
+    import numpy as np
+    a, b = _permutations()
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    for start in range(0, len(hashes), _BLOCK):
+        # uint64 arithmetic wraps, giving (a * h + b) mod 2**64; the top 32 bits are the hash
+        block = (a * hashes[start:start + _BLOCK] + b) >> np.uint64(32)
+        np.minimum(signature, block.min(axis=1).astype(np.uint32), out=signature)
+    return signature.astype("<u4").tobytes()
+
+def fingerprint(texts: Sequence[str]) -> Optional[Fingerprint]:
+    """Fingerprint a document from its chunk texts; None when they contain no words."""
+    chunk_tokens = [_TOKEN_RE.findall(chunk.lower()) for chunk in texts]
+    hashes = shingle_hashes(chunk_tokens)
+    if not len(hashes):
+        return None
+    return Fingerprint(
+        signature=minhash(hashes),
+        chunk_hashes=[_hash64(" ".join(tokens).encode("utf-8")) for tokens in chunk_tokens]
+    )
+
+def similarity(signature_a: bytes, signature_b: bytes) -> float:
+    """Estimated Jaccard similarity: the share of equal signature entries."""
+    import numpy as np
+    return float(np.mean(np.frombuffer(signature_a, dtype="<u4") == np.frombuffer(signature_b, dtype="<u4")))
+
+def band_keys(signature: bytes) -> List[int]:
+    """One signed 64-bit bucket key per band; the band number is part of the key."""
+    width = ROWS * 4
+    return [
+        int.from_bytes(_hash64(bytes([band]) + signature[band * width:(band + 1) * width]), "little", signed=True)
+        for band in range(BANDS)
+    ]
+
+def create_index(conn):
+    """Create the signature and bucket tables."""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS document_signature ("
+        "id INTEGER PRIMARY KEY, user_id VARCHAR(36) NOT NULL, thread_id VARCHAR(36) NOT NULL, "
+        "signature BLOB NOT NULL, chunk_hashes BLOB NOT NULL, created_at DATETIME)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_document_signature_thread_id ON document_signature (thread_id)"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS document_lsh ("
+        "user_id VARCHAR(36) NOT NULL, bucket INTEGER NOT NULL, doc_id INTEGER NOT NULL, "
+        "PRIMARY KEY (user_id, bucket, doc_id)) WITHOUT ROWID"
+    ))
+
+def index_document(conn, user_id: str, thread_id: str, fingerprint: Fingerprint, created_at: Optional[str] = None):
+    """Index the source document of one thread."""
+    doc_id = conn.execute(
+        text(
+            "INSERT INTO document_signature (user_id, thread_id, signature, chunk_hashes, created_at) "
+            "VALUES (:user_id, :thread_id, :signature, :chunk_hashes, :created_at) RETURNING id"
+        ),
+        {
+            "user_id": user_id,
+            "thread_id": thread_id,
+            "signature": fingerprint.signature,
+            "chunk_hashes": fingerprint.chunk_blob,
+            "created_at": created_at,
+        }
+    ).scalar()
+    conn.execute(
+        text("INSERT OR IGNORE INTO document_lsh (user_id, bucket, doc_id) VALUES (:user_id, :bucket, :doc_id)"),
+        [{"user_id": user_id, "bucket": bucket, "doc_id": doc_id} for bucket in band_keys(fingerprint.signature)]
+    )
+
+def remove_document(conn, thread_id: str):
+    """Drop the documents indexed for a thread."""
+    rows = conn.execute(
+        text("SELECT id, user_id, signature FROM document_signature WHERE thread_id = :thread_id"),
+        {"thread_id": thread_id}
+    ).fetchall()
+    for row in rows:
+        # Deleting by bucket keeps to the primary key instead of scanning for doc_id
+        conn.execute(
+            text("DELETE FROM document_lsh WHERE user_id = :user_id AND bucket IN :buckets AND doc_id = :doc_id")
+            .bindparams(bindparam("buckets", expanding=True)),
+            {"user_id": row.user_id, "buckets": band_keys(row.signature), "doc_id": row.id}
+        )
+        conn.execute(text("DELETE FROM document_signature WHERE id = :id"), {"id": row.id})
+
+def find_similar(conn, user_id: str, fingerprint: Fingerprint, threshold: float) -> Optional[Match]:
+    """Return the user's most similar indexed document at or above ``threshold``, newest on ties."""
+    rows = conn.execute(
+        text(
+            "SELECT id, thread_id, signature, chunk_hashes FROM document_signature WHERE id IN ("
+            "SELECT doc_id FROM document_lsh WHERE user_id = :user_id AND bucket IN :buckets)"
+        ).bindparams(bindparam("buckets", expanding=True)),
+        {"user_id": user_id, "buckets": band_keys(fingerprint.signature)}
+    ).fetchall()
+
+    best = None
+    for row in rows:
+        score = similarity(fingerprint.signature, row.signature)
+        if score >= threshold and (best is None or (score, row.id) > best[0]):
+            best = ((score, row.id), row)
+    if best is None:
+        return None
+
+    (score, _), row = best
+    known = {row.chunk_hashes[i:i + 8] for i in range(0, len(row.chunk_hashes), 8)}
+    return Match(
+        thread_id=row.thread_id,
+        similarity=score,
+        changed_chunks=[i for i, chunk_hash in enumerate(fingerprint.chunk_hashes) if chunk_hash not in known],
+        total_chunks=len(fingerprint.chunk_hashes)
+    )
@@ -0,0 +1,97 @@
+"""Document sources: type detection, spooled upload buffers and page readers.
+
+Uploads are parsed straight from memory, or from an unnamed temporary file
+once they outgrow ``SPOOL_MAX_MEMORY``; nothing is written under the
+upload's own name.
+"""
+import codecs
+import io
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+DocumentSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+# Uploads up to this size stay in memory; larger ones spill to disk
+SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", 8 * 1024 * 1024))
+# PDF readers accept the header anywhere in the first KiB
+SNIFF_BYTES = 1024
+# Text documents are decoded this many bytes at a time
+TEXT_BLOCK_BYTES = 256 * 1024
+_COPY_BYTES = 1024 * 1024
+
+def spool(stream: BinaryIO, max_memory: int = SPOOL_MAX_MEMORY) -> tempfile.SpooledTemporaryFile:
+    """Copy ``stream`` into a buffer that outlives the request, rewound to the start."""
+    buffer = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    shutil.copyfileobj(stream, buffer, _COPY_BYTES)
+    buffer.seek(0)
+    return buffer
+
+@contextmanager
+def open_source(source: DocumentSource) -> Iterator[BinaryIO]:
+    """Yield a seekable binary stream for a path, a bytes-like object or a file object.
+
+    Files opened here are closed on exit; a caller's file object is left open.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield f
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+    elif source.seekable():
+        yield source
+    else:
+        with spool(source) as buffer:
+            yield buffer
+
+def detect_type(stream: BinaryIO) -> str:
+    """Return ``"pdf"`` or ``"txt"`` from the leading bytes, leaving the stream rewound."""
+    start = stream.tell()
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(start)
+
+    if b"%PDF-" in head:
+        return "pdf"
+    if b"\x00" not in head:
+        try:
+            # Not final: the sample may end inside a multi-byte character
+            codecs.getincrementaldecoder("utf-8-sig")().decode(head, final=False)
+            return "txt"
+        except UnicodeDecodeError:
+            pass
+    raise ValueError("Unsupported file type: expected a PDF or UTF-8 text document")
+
+def _iter_pdf_pages(stream: BinaryIO) -> Iterator[Tuple[str, Optional[int]]]:
+    # Imported on first use; the web process only spools uploads
+    from pypdf import PdfReader
+
+    for number, page in enumerate(PdfReader(stream).pages):
+        yield page.extract_text().strip(), number
+
+def _iter_text_blocks(stream: BinaryIO, block_bytes: int) -> Iterator[Tuple[str, Optional[int]]]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    while True:
+        data = stream.read(block_bytes)
+        pending += decoder.decode(data, final=not data)
+        if not data:
+            break
+        # Cut at the last paragraph break so the splitter sees whole paragraphs
+        cut = pending.rfind("\n\n")
+        if cut > 0:
+            yield pending[:cut + 2], None
+            pending = pending[cut + 2:]
+    if pending:
+        yield pending, None
+
+def iter_pages(stream: BinaryIO, file_type: str, block_bytes: int = TEXT_BLOCK_BYTES) -> Iterator[Tuple[str, Optional[int]]]:
+    """Lazily yield ``(text, page)`` for each PDF page or text block.
+
+    Text blocks carry no page number and, joined, reproduce the decoded
+    document exactly.
+    """
+    if file_type == "pdf":
+        return _iter_pdf_pages(stream)
+    return _iter_text_blocks(stream, block_bytes)
@@ -0,0 +1,189 @@
+"""Background job queue for document-to-thread generation."""
+import abc
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Progress stages reported by the upload pipeline, in order
+JOB_STAGES = ("queued", "parsing", "splitting", "summarizing", "title", "outline", "post", "generating", "saving", "done")
+
+_worker_state = threading.local()
+# Coroutine functions called with each loop run_async is about to close, e.g. to close loop-bound clients
+_loop_closers: List[Callable[[asyncio.AbstractEventLoop], Awaitable[None]]] = []
+
+def on_loop_close(fn: Callable[[asyncio.AbstractEventLoop], Awaitable[None]]):
+    """Register ``await fn(loop)`` to run before a short-lived ``run_async`` loop is closed."""
+    _loop_closers.append(fn)
+    return fn
+
+def _close_loop(loop: asyncio.AbstractEventLoop):
+    try:
+        for fn in _loop_closers:
+            try:
+                loop.run_until_complete(fn(loop))
+            except Exception as e:
+                logger.warning("Closing loop resources failed: %s", e)
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    finally:
+        loop.close()
+
+def _init_worker():
+    _worker_state.persistent = True
+
+def run_async(coro):
+    """Run a coroutine to completion from synchronous code.
+
+    Job workers keep one event loop for their lifetime instead of creating
+    a new loop per call. Other threads, such as the development server's
+    per-request threads, get a loop for this call only; it is closed
+    afterwards together with the clients bound to it (see ``on_loop_close``).
+    """
+    if getattr(_worker_state, "persistent", False):
+        loop = getattr(_worker_state, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = asyncio.new_event_loop()
+            _worker_state.loop = loop
+        return loop.run_until_complete(coro)
+    
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        _close_loop(loop)
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+@dataclass
+class Job:
+    id: str
+    user_id: str
+    status: str = "queued"  # queued, running, succeeded, failed
+    stage: str = "queued"
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # Seconds to wait before resubmitting, when the job failed on rate limits
+    retry_after: Optional[float] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "retry_after": self.retry_after,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+class JobBackend(abc.ABC):
+    """Interface for job backends.
+
+    A backend accepts a callable of the form ``fn(report, *args)`` where
+    ``report(stage)`` records pipeline progress, runs it off the request
+    thread and keeps the job record available for status lookups.
+    """
+
+    @abc.abstractmethod
+    def submit(self, user_id: str, fn: Callable, *args) -> Job:
+        ...
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        ...
+
+    def shutdown(self, wait: bool = True):
+        pass
+
+class ThreadPoolJobBackend(JobBackend):
+    """In-process backend running jobs on a bounded thread pool."""
+
+    def __init__(self, max_workers: int = 4, max_queue_depth: int = 32, retention_seconds: int = 3600):
+        self.max_queue_depth = max_queue_depth
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thread-job", initializer=_init_worker)
+        self._jobs: Dict[str, Job] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: str, fn: Callable, *args) -> Job:
+        with self._lock:
+            if self._pending >= self.max_queue_depth:
+                raise QueueFullError("Job queue is full, please retry shortly")
+            self._purge_expired()
+            job = Job(id=uuid.uuid4().hex, user_id=user_id)
+            self._jobs[job.id] = job
+            self._pending += 1
+        # Carry the submitting request's trace into the worker
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._run, job, fn, args)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _update(self, job: Job, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated_at = time.time()
+
+    def _report(self, job: Job, stage: str):
+        if stage not in JOB_STAGES:
+            raise ValueError(f"Unknown job stage: {stage}")
+        self._update(job, stage=stage)
+
+    def _run(self, job: Job, fn: Callable, args: tuple):
+        metrics.observe_stage("queue_wait", time.time() - job.created_at)
+        self._update(job, status="running")
+        try:
+            with metrics.timed("job"):
+                result = fn(lambda stage: self._report(job, stage), *args)
+            self._update(job, status="succeeded", stage="done", result=result)
+        except Exception as e:
+            logger.warning("Job %s failed: %s", job.id, e)
+            self._update(job, status="failed", error=str(e), retry_after=getattr(e, "retry_after", None))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _purge_expired(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+# Registered backends; external queues (e.g. Redis) plug in by adding an entry
+BACKENDS = {
+    "thread": ThreadPoolJobBackend,
+}
+
+def create_job_backend(name: str = "thread", **options) -> JobBackend:
+    """Create a job backend by name."""
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown job backend: {name}")
+    return backend_cls(**options)
@@ -0,0 +1,209 @@
+"""Long-lived LLM clients with shared keep-alive connection pools."""
+import asyncio
+import itertools
+import os
+import threading
+import time
+import weakref
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import Runnable
+
+from config import AIConfig
+from jobs import on_loop_close
+import metrics
+import rate_limit
+from selection import count_tokens
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Count prompt and completion tokens reported at the end of each LLM call."""
+
+    def on_llm_end(self, response, **kwargs):
+        output = response.llm_output or {}
+        usage = output.get("token_usage") or {}
+        model = output.get("model_name")
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+
+        if prompt_tokens is None:
+            # Streamed responses carry usage on the message instead
+            prompt_tokens = completion_tokens = 0
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    usage_metadata = getattr(message, "usage_metadata", None) or {}
+                    prompt_tokens += usage_metadata.get("input_tokens", 0)
+                    completion_tokens += usage_metadata.get("output_tokens", 0)
+                    model = model or getattr(message, "response_metadata", {}).get("model_name")
+
+        model = model or "unknown"
+        if prompt_tokens:
+            metrics.LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+        if completion_tokens:
+            metrics.LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+
+token_usage_handler = TokenUsageHandler()
+
+
+class LLMClientRegistry:
+    """Hand out one ChatOpenAI chain per (model, temperature, max_tokens, timeout).
+
+    All clients share one synchronous httpx pool. Async pools are bound to
+    an event loop, so each loop (e.g. a job worker's persistent loop) gets
+    its own shared async pool and client instances. Short-lived loops from
+    ``run_async`` close theirs through ``aclose_loop``.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20, keepalive_expiry: float = 30):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._http_client: Optional[httpx.Client] = None
+        self._chains: Dict[Tuple, object] = {}
+        # Per event loop: (async http client, chains); dropped with the loop
+        self._loop_state: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def _get_http_client(self) -> httpx.Client:
+        # Caller holds the lock
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self.limits)
+        return self._http_client
+
+    def _new_chain(self, config: AIConfig, **options):
+        # The OpenAI SDK is slow to import; load it with the first chain
+        from langchain_openai import ChatOpenAI
+
+        llm = ChatOpenAI(
+            model_name=config.model_name,
+            temperature=config.temperature,
+            max_tokens=config.max_tokens,
+            http_client=self._get_http_client(),
+            # Report token usage for streamed responses too
+            stream_usage=True,
+            callbacks=[token_usage_handler],
+            # Retries and backoff are left to the rate limiter (see rate_limit.py)
+            max_retries=0,
+            timeout=config.request_timeout,
+            **options
+        )
+        return llm | StrOutputParser()
+
+    def get_chain(self, config: AIConfig):
+        """Return the shared ``llm | StrOutputParser()`` chain for a config."""
+        key = (config.model_name, config.temperature, config.max_tokens, config.request_timeout)
+        loop = self._running_loop()
+        with self._lock:
+            if loop is None:
+                chains = self._chains
+                options = {}
+            else:
+                state = self._loop_state.get(loop)
+                if state is None:
+                    state = (httpx.AsyncClient(limits=self.limits), {})
+                    self._loop_state[loop] = state
+                chains = state[1]
+                options = {"http_async_client": state[0]}
+            
+            chain = chains.get(key)
+            if chain is None:
+                chain = self._new_chain(config, **options)
+                chains[key] = chain
+            return chain
+
+    async def aclose_loop(self, loop: asyncio.AbstractEventLoop):
+        """Close the async pool bound to ``loop`` and drop its chains; run before the loop closes."""
+        with self._lock:
+            state = self._loop_state.pop(loop, None)
+        if state is not None:
+            await state[0].aclose()
+
+    def close(self):
+        """Close the synchronous pool and forget every client."""
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._chains.clear()
+            self._loop_state.clear()
+
+class ScheduledRunnable(Runnable):
+    """Run ``bound`` through a RateLimitScheduler, taking one slot per attempt.
+
+    ``batch`` and ``abatch`` fall back to ``invoke``/``ainvoke`` per input, so
+    batched calls are scheduled one by one. A stream is only retried until
+    its first chunk has been yielded.
+    """
+
+    def __init__(self, bound: Runnable, scheduler: rate_limit.RateLimitScheduler, model_name: str, max_tokens: int, timeout: float):
+        self.bound = bound
+        self.scheduler = scheduler
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+
+    def _tokens(self, input: Any) -> int:
+        return count_tokens(input if isinstance(input, str) else str(input), self.model_name) + self.max_tokens
+
+    def invoke(self, input: Any, config=None, **kwargs) -> Any:
+        tokens = self._tokens(input)
+        for attempt in itertools.count():
+            self.scheduler.acquire(tokens)
+            try:
+                return self.bound.invoke(input, config, **kwargs)
+            except Exception as e:
+                time.sleep(self.scheduler.retry_delay(e, attempt))
+
+    async def ainvoke(self, input: Any, config=None, **kwargs) -> Any:
+        tokens = self._tokens(input)
+        for attempt in itertools.count():
+            await self.scheduler.aacquire(tokens)
+            try:
+                return await asyncio.wait_for(self.bound.ainvoke(input, config, **kwargs), self.timeout)
+            except Exception as e:
+                await asyncio.sleep(self.scheduler.retry_delay(e, attempt))
+
+    def stream(self, input: Any, config=None, **kwargs) -> Iterator[Any]:
+        tokens = self._tokens(input)
+        for attempt in itertools.count():
+            self.scheduler.acquire(tokens)
+            started = False
+            try:
+                for part in self.bound.stream(input, config, **kwargs):
+                    started = True
+                    yield part
+                return
+            except Exception as e:
+                if started:
+                    raise
+                time.sleep(self.scheduler.retry_delay(e, attempt))
+
+def scheduled(chain: Runnable, config) -> ScheduledRunnable:
+    """Wrap ``chain`` so every call made with ``config`` goes through ``rate_limit.scheduler``."""
+    return ScheduledRunnable(chain, rate_limit.scheduler, config.model_name, config.max_tokens, config.request_timeout)
+
+@lru_cache(maxsize=256)
+def get_prompt(template: str) -> PromptTemplate:
+    """Parse a prompt template once and reuse it."""
+    return PromptTemplate.from_template(template)
+
+llm_registry = LLMClientRegistry(
+    max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.getenv("LLM_POOL_MAX_KEEPALIVE", 20)),
+    keepalive_expiry=float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", 30))
+)
+on_loop_close(llm_registry.aclose_loop)
@@ -1,4 +1,11 @@
-from app import app
+import multiprocessing
+
+# Batch parse workers are spawned and re-import this module as __mp_main__;
+# only the parent process creates the app (migrations, flusher, warm-up)
+if multiprocessing.parent_process() is None:
+    from app import create_app
+
+    app = create_app()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,189 @@
+"""Pipeline instrumentation: Prometheus metrics, trace ids and stage timings."""
+import contextvars
+import functools
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from flask import before_render_template, g, request, template_rendered
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# LLM calls and whole requests run far longer than the default buckets cover
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "threadsynth_stage_seconds", "Time spent in each pipeline stage", ["stage"], buckets=SLOW_BUCKETS
+)
+LLM_CALL_SECONDS = Histogram(
+    "threadsynth_llm_call_seconds", "Latency of LLM calls that reached the model", ["model"], buckets=SLOW_BUCKETS
+)
+LLM_CALLS = Counter(
+    "threadsynth_llm_calls_total", "LLM calls by response cache status (hit, miss, bypass)", ["model", "cache"]
+)
+LLM_TOKENS = Counter(
+    "threadsynth_llm_tokens_total", "Tokens reported by the LLM provider", ["model", "type"]
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "threadsynth_llm_queue_seconds", "Time LLM calls waited for a rate-limit slot", ["priority"], buckets=SLOW_BUCKETS
+)
+LLM_THROTTLED = Counter(
+    "threadsynth_llm_throttled_total", "LLM calls held back, by the limit that held them", ["limit"]
+)
+LLM_RETRIES = Counter(
+    "threadsynth_llm_retries_total", "LLM calls retried after a rate-limit error or timeout", ["reason"]
+)
+DUPLICATE_UPLOADS = Counter(
+    "threadsynth_duplicate_uploads_total", "Uploads matching an earlier document, by what was done (offered, regenerated)", ["action"]
+)
+SUPABASE_SECONDS = Histogram(
+    "threadsynth_supabase_call_seconds", "Latency of Supabase calls", ["operation", "status"]
+)
+RENDER_SECONDS = Histogram(
+    "threadsynth_template_render_seconds", "Template rendering time", ["template"]
+)
+REQUEST_SECONDS = Histogram(
+    "threadsynth_http_request_seconds", "Time to produce an HTTP response", ["endpoint", "method", "status"],
+    buckets=SLOW_BUCKETS
+)
+
+_trace_id: contextvars.ContextVar = contextvars.ContextVar("trace_id", default=None)
+_timings: contextvars.ContextVar = contextvars.ContextVar("timings", default=None)
+
+_TRACE_ID_RE = re.compile(r"^[\w\-]{1,64}$")
+
+# Trace context
+
+def new_trace(trace_id: Optional[str] = None) -> str:
+    """Start a trace in the current context, reusing a well-formed incoming id."""
+    if not trace_id or not _TRACE_ID_RE.match(trace_id):
+        trace_id = uuid.uuid4().hex
+    _trace_id.set(trace_id)
+    _timings.set({})
+    return trace_id
+
+def get_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+def get_timings() -> Dict[str, float]:
+    """Seconds spent per stage (plus ``llm`` and ``supabase``) in the current trace."""
+    return dict(_timings.get() or {})
+
+def _add_timing(name: str, seconds: float):
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+# Recording
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    _add_timing(stage, seconds)
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as one pipeline stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+def observe_llm_call(model: str, cache: str, seconds: Optional[float] = None):
+    """Count an LLM call; ``seconds`` is given for calls that reached the model."""
+    LLM_CALLS.labels(model, cache).inc()
+    if seconds is not None:
+        LLM_CALL_SECONDS.labels(model).observe(seconds)
+        _add_timing("llm", seconds)
+
+def observe_llm_queue(priority: str, seconds: float):
+    LLM_QUEUE_SECONDS.labels(priority).observe(seconds)
+    _add_timing("llm_queue", seconds)
+
+def track_supabase(fn):
+    """Time an async Supabase call returning ``(data, error)``."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = await fn(*args, **kwargs)
+        seconds = time.perf_counter() - started
+        failed = isinstance(result, tuple) and len(result) == 2 and result[1] is not None
+        SUPABASE_SECONDS.labels(fn.__name__, "error" if failed else "ok").observe(seconds)
+        _add_timing("supabase", seconds)
+        return result
+    return wrapper
+
+def render_latest():
+    """Return ``(body, content_type)`` for the Prometheus exposition format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+# Logging
+
+class TraceIdFilter(logging.Filter):
+    """Attach the current trace id to every log record."""
+
+    def filter(self, record):
+        record.trace_id = _trace_id.get() or "-"
+        return True
+
+def configure_logging(level: str = "INFO"):
+    """Configure root logging with the trace id in every line.
+
+    Call sites use ``logger.debug("...", arg)`` so disabled levels skip
+    formatting entirely.
+    """
+    logging.basicConfig(
+        level=level.upper(),
+        format="%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"
+    )
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
+
+# Flask integration
+
+def init_app(app, slow_request_seconds: Optional[float] = None):
+    """Trace every request, time responses and templates, and log slow requests.
+
+    The trace id comes from a valid ``X-Request-ID`` header or is generated,
+    and is echoed back on the response.
+    """
+    @app.before_request
+    def start_trace():
+        new_trace(request.headers.get("X-Request-ID"))
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def finish_trace(response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_SECONDS.labels(endpoint, request.method, str(response.status_code)).observe(seconds)
+        response.headers["X-Request-ID"] = get_trace_id()
+        if slow_request_seconds is not None and seconds >= slow_request_seconds:
+            logger.warning(
+                "Slow request %s %s: %.3fs (status %s) %s",
+                request.method, request.path, seconds, response.status_code,
+                {name: round(value, 3) for name, value in get_timings().items()}
+            )
+        return response
+
+    def render_started(sender, template, context, **extra):
+        g.setdefault("render_started", []).append(time.perf_counter())
+
+    def render_finished(sender, template, context, **extra):
+        stack = g.get("render_started")
+        if stack:
+            seconds = time.perf_counter() - stack.pop()
+            RENDER_SECONDS.labels(template.name or "string").observe(seconds)
+            _add_timing("render", seconds)
+
+    # Signals hold weak references; these closures have no other owner
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
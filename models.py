@@ -1,14 +1,35 @@
-from app import db
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import DeclarativeBase
 from datetime import datetime
 
+class Base(DeclarativeBase):
+    pass
+
+db = SQLAlchemy(model_class=Base)
+
 class Thread(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # Supabase threads.id; shared by the local copy and the remote row
+    remote_id = db.Column(db.String(36), unique=True, index=True)
+    user_id = db.Column(db.String(36), index=True)
     title = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    posts = db.relationship('ThreadPost', backref='thread', lazy=True)
+    # Set when the content changes; write-behind bookkeeping leaves it alone
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Write-behind state: rows with synced=False still have to reach Supabase
+    synced = db.Column(db.Boolean, default=False, index=True)
+    sync_attempts = db.Column(db.Integer, default=0)
+    next_sync_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sync_error = db.Column(db.Text)
+    # Cleaned display (JSON) and export forms, computed when the thread is stored
+    display_json = db.Column(db.Text)
+    export_text = db.Column(db.Text)
+    posts = db.relationship('ThreadPost', backref='thread', lazy=True, order_by='ThreadPost.position',
+                            cascade='all, delete-orphan')
 
 class ThreadPost(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     thread_id = db.Column(db.Integer, db.ForeignKey('thread.id'), nullable=False)
+    position = db.Column(db.Integer, default=0)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,365 @@
+"""Shared scheduler for LLM calls: rate limits, fair queueing and retries.
+
+Every chain handed out by ``agents._get_chain`` is wrapped by
+``llm_clients.scheduled``. Before each attempt a call takes one request and
+its estimated tokens (prompt plus ``max_tokens``, as providers count them)
+from token buckets for the whole process and for the calling user. Waiting calls are granted by
+priority, then round-robin across users, so one user's batch cannot starve
+everyone else. Rate-limit errors and timeouts are retried with jittered
+exponential backoff.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Highest first; interactive calls have someone watching a stream
+PRIORITIES = ("interactive", "normal", "batch")
+# Per-user buckets kept before full, idle ones are dropped
+MAX_TRACKED_USERS = 10000
+
+_caller_user: contextvars.ContextVar = contextvars.ContextVar("llm_caller_user", default=None)
+_caller_priority: contextvars.ContextVar = contextvars.ContextVar("llm_caller_priority", default="normal")
+
+class RateLimitExceeded(Exception):
+    """An LLM call stayed rate limited through every retry, or waited too long for a slot."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def set_caller(user_id: Optional[str], priority: str = "normal"):
+    """Attribute LLM calls made from the current context (and jobs it submits) to ``user_id``."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Priority must be one of: {', '.join(PRIORITIES)}")
+    _caller_user.set(user_id)
+    _caller_priority.set(priority)
+
+class TokenBucket:
+    """``per_minute`` units per minute, with bursts of up to ``burst_seconds`` worth."""
+
+    def __init__(self, per_minute: float, now: float, burst_seconds: float = 60):
+        self.rate = per_minute / 60
+        self.capacity = self.rate * burst_seconds
+        self.level = self.capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_seconds(self, amount: float) -> float:
+        # A request larger than the bucket waits for a full bucket, not forever
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    @property
+    def full(self) -> bool:
+        return self.level >= self.capacity
+
+def _buckets(requests_per_minute: float, tokens_per_minute: float, now: float, burst_seconds: float) -> Dict[str, TokenBucket]:
+    # A non-positive limit disables that bucket
+    buckets = {}
+    if requests_per_minute > 0:
+        buckets["rpm"] = TokenBucket(requests_per_minute, now, burst_seconds)
+    if tokens_per_minute > 0:
+        buckets["tpm"] = TokenBucket(tokens_per_minute, now, burst_seconds)
+    return buckets
+
+@dataclass(eq=False)
+class _Ticket:
+    user: str
+    priority: str
+    tokens: int
+    notify: Callable[[], None]
+    enqueued: float
+    throttled_by: Optional[str] = None
+
+def _retry_reason(error: Exception) -> Optional[str]:
+    # Imported here so the web process does not load the OpenAI SDK until a call fails
+    import httpx
+    import openai
+
+    if isinstance(error, openai.RateLimitError) or getattr(error, "status_code", None) == 429:
+        # An exhausted quota is reported as a 429 but never clears by waiting
+        if getattr(error, "code", None) == "insufficient_quota":
+            return None
+        return "rate_limited"
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+    return None
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date values are rare from LLM APIs; fall back to backoff
+        pass
+    return None
+
+class RateLimitScheduler:
+    """Grant LLM call slots under global and per-user request and token limits.
+
+    A dispatcher thread hands out slots as buckets refill, so sync callers
+    (``acquire``) and callers on any event loop (``aacquire``) share one
+    queue. Within a priority, users take turns one slot at a time.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        user_requests_per_minute: float = 0,
+        user_tokens_per_minute: float = 0,
+        burst_seconds: float = 60,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        max_wait: float = 300.0
+    ):
+        now = time.monotonic()
+        self.user_requests_per_minute = user_requests_per_minute
+        self.user_tokens_per_minute = user_tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self._global = _buckets(requests_per_minute, tokens_per_minute, now, burst_seconds)
+        self._users: Dict[str, Dict[str, TokenBucket]] = {}
+        # Per priority: user -> waiting tickets; dict order is the turn order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Ticket]]"] = {priority: OrderedDict() for priority in PRIORITIES}
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._counters = {
+            "granted": 0,
+            "throttled": 0,
+            "expired": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "timeouts": 0,
+        }
+        self._wait_total = 0.0
+
+    # Slots
+
+    def acquire(self, tokens: int):
+        """Block until the calling context may make one call of ``tokens`` tokens."""
+        granted = threading.Event()
+        ticket = self._enqueue(tokens, granted.set)
+        if not granted.wait(self.max_wait) and self._cancel(ticket):
+            raise self._expired()
+        self._record_grant(ticket)
+
+    async def aacquire(self, tokens: int):
+        """Async ``acquire``; the event loop keeps running while the call waits."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def resolve():
+            if not granted.done():
+                granted.set_result(None)
+
+        def notify():
+            try:
+                loop.call_soon_threadsafe(resolve)
+            except RuntimeError:
+                # The waiting loop has closed; nobody is left to take the slot
+                pass
+
+        ticket = self._enqueue(tokens, notify)
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait)
+        except asyncio.TimeoutError:
+            if self._cancel(ticket):
+                raise self._expired()
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            raise
+        self._record_grant(ticket)
+
+    def pause(self, seconds: float):
+        """Hold every queued call for ``seconds``, e.g. after the provider reports its limit hit."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify()
+
+    def _enqueue(self, tokens: int, notify: Callable[[], None]) -> _Ticket:
+        priority = _caller_priority.get()
+        ticket = _Ticket(_caller_user.get() or "anonymous", priority, tokens, notify, time.monotonic())
+        with self._condition:
+            self._queues[priority].setdefault(ticket.user, deque()).append(ticket)
+            # Grant straight away when there is room; the dispatcher handles the rest
+            self._dispatch(time.monotonic())
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._run_dispatcher, name="llm-rate-limit", daemon=True)
+                self._dispatcher.start()
+            self._condition.notify()
+        return ticket
+
+    def _cancel(self, ticket: _Ticket) -> bool:
+        """Withdraw a waiting ticket; False if it was granted in the meantime."""
+        with self._condition:
+            queue = self._queues[ticket.priority]
+            tickets = queue.get(ticket.user)
+            if tickets is None or ticket not in tickets:
+                return False
+            tickets.remove(ticket)
+            if not tickets:
+                del queue[ticket.user]
+            return True
+
+    def _expired(self) -> RateLimitExceeded:
+        with self._condition:
+            self._counters["expired"] += 1
+        return RateLimitExceeded(f"No LLM capacity within {self.max_wait} seconds", retry_after=self.backoff_max)
+
+    def _record_grant(self, ticket: _Ticket):
+        waited = time.monotonic() - ticket.enqueued
+        metrics.observe_llm_queue(ticket.priority, waited)
+        if ticket.throttled_by:
+            metrics.LLM_THROTTLED.labels(ticket.throttled_by).inc()
+        with self._condition:
+            self._counters["granted"] += 1
+            self._counters["throttled"] += ticket.throttled_by is not None
+            self._wait_total += waited
+
+    # Dispatch
+
+    def _run_dispatcher(self):
+        with self._condition:
+            while True:
+                self._condition.wait(timeout=self._dispatch(time.monotonic()))
+
+    def _user_buckets(self, user: str, now: float) -> Dict[str, TokenBucket]:
+        buckets = self._users.get(user)
+        if buckets is None:
+            if len(self._users) >= MAX_TRACKED_USERS:
+                for idle in [name for name, held in self._users.items() if all(b.full for b in held.values())]:
+                    del self._users[idle]
+            buckets = _buckets(self.user_requests_per_minute, self.user_tokens_per_minute, now, self.burst_seconds)
+            self._users[user] = buckets
+        return buckets
+
+    def _wait_seconds(self, ticket: _Ticket, now: float) -> Tuple[float, Optional[str]]:
+        """Longest wait any limit imposes on ``ticket``, and which limit that is."""
+        longest, limit = 0.0, None
+        for scope, buckets in (("global", self._global), ("user", self._user_buckets(ticket.user, now))):
+            for name, bucket in buckets.items():
+                bucket.refill(now)
+                wait = bucket.wait_seconds(1 if name == "rpm" else ticket.tokens)
+                if wait > longest:
+                    longest, limit = wait, f"{scope}_{name}"
+        return longest, limit
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """Grant every ticket that fits now; return seconds until the next may fit.
+
+        Caller holds the condition's lock.
+        """
+        if now < self._paused_until:
+            return self._paused_until - now
+        wake = None
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            granted = True
+            while queue and granted:
+                # One pass gives each waiting user at most one slot
+                granted = False
+                for user in list(queue):
+                    ticket = queue[user][0]
+                    wait, limit = self._wait_seconds(ticket, now)
+                    if wait > 0:
+                        ticket.throttled_by = ticket.throttled_by or limit
+                        wake = wait if wake is None else min(wake, wait)
+                        if limit.startswith("global"):
+                            # Later tickets queue behind this one rather than overtake it
+                            return wake
+                        continue
+                    for buckets in (self._global, self._user_buckets(user, now)):
+                        for name, bucket in buckets.items():
+                            bucket.take(1 if name == "rpm" else ticket.tokens)
+                    queue[user].popleft()
+                    if queue[user]:
+                        queue.move_to_end(user)
+                    else:
+                        del queue[user]
+                    ticket.notify()
+                    granted = True
+        return wake
+
+    # Retries
+
+    def retry_delay(self, error: Exception, attempt: int) -> float:
+        """Seconds to wait before retrying a failed call, or raise if it should not be retried."""
+        reason = _retry_reason(error)
+        if reason is None:
+            raise error
+        with self._condition:
+            self._counters["rate_limited" if reason == "rate_limited" else "timeouts"] += 1
+        retry_after = _retry_after(error)
+        if attempt >= self.max_retries:
+            if reason == "rate_limited":
+                raise RateLimitExceeded(
+                    f"LLM rate limit still exceeded after {attempt + 1} attempts",
+                    retry_after=retry_after or self.backoff_max
+                ) from error
+            raise TimeoutError(f"LLM call timed out after {attempt + 1} attempts") from error
+
+        # Full jitter keeps retrying callers from arriving together
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+            # The provider's limit is shared, so everyone waits it out
+            self.pause(retry_after)
+        metrics.LLM_RETRIES.labels(reason).inc()
+        with self._condition:
+            self._counters["retries"] += 1
+        logger.info("Retrying LLM call in %.2fs after %s (attempt %d)", delay, reason, attempt + 1)
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters and the current queue."""
+        with self._condition:
+            waiting = {
+                priority: sum(len(tickets) for tickets in queue.values())
+                for priority, queue in self._queues.items()
+            }
+            granted = self._counters["granted"]
+            return {
+                **self._counters,
+                "queued": waiting,
+                "queued_users": len({user for queue in self._queues.values() for user in queue}),
+                "avg_wait_ms": self._wait_total * 1000 / granted if granted else 0.0,
+                "paused_seconds": max(0.0, self._paused_until - time.monotonic()),
+            }
+
+scheduler = RateLimitScheduler(
+    requests_per_minute=float(os.getenv("LLM_RPM", 500)),
+    tokens_per_minute=float(os.getenv("LLM_TPM", 200000)),
+    user_requests_per_minute=float(os.getenv("LLM_USER_RPM", 0)),
+    user_tokens_per_minute=float(os.getenv("LLM_USER_TPM", 0)),
+    burst_seconds=float(os.getenv("LLM_BURST_SECONDS", 60)),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", 4)),
+    backoff_base=float(os.getenv("LLM_BACKOFF_BASE", 1)),
+    backoff_max=float(os.getenv("LLM_BACKOFF_MAX", 60)),
+    max_wait=float(os.getenv("LLM_MAX_QUEUE_SECONDS", 300))
+)
@@ -0,0 +1,131 @@
+"""Precomputed display and export forms of threads, and a cache of rendered fragments.
+
+Threads rarely change after they are generated, so the cleaned forms are
+built once when a thread is stored. The thread view and export routes
+serve them with an ETag derived from the rendered content and
+Last-Modified from ``updated_at``, and keep rendered fragments in memory
+until the thread's content changes.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Stored display forms with another version are rebuilt on startup
+DISPLAY_VERSION = 2
+
+def _clean(text: str) -> str:
+    return text.replace('**', '').replace('*', '').replace('"', '').strip()
+
+def display_form(title: str, content: List[str], created_at: Optional[datetime]) -> dict:
+    """Title, timestamp and per-post paragraphs as shown on the thread page.
+
+    Markdown emphasis and double quotes are stripped and blank paragraphs
+    dropped.
+    """
+    return {
+        'version': DISPLAY_VERSION,
+        'title': _clean(title),
+        'timestamp': created_at.strftime('%B %d, %Y %H:%M') if created_at else '',
+        'posts': [[_clean(line) for line in post.split('\n\n') if line.strip()] for post in content],
+    }
+
+def export_form(title: str, content: List[str]) -> str:
+    """Plain-text export: the title, then each post, separated by blank lines.
+
+    Quotes are kept in posts; only emphasis markers are removed.
+    """
+    parts = [f"🧵 {_clean(title)}\n\n"]
+    parts += [f"{post.replace('**', '').replace('*', '').strip()}\n\n" for post in content]
+    return ''.join(parts)
+
+def render_thread(title: str, content: List[str], created_at: Optional[datetime]) -> Tuple[str, str]:
+    """Return ``(display_json, export_text)`` for storing alongside a thread."""
+    return json.dumps(display_form(title, content, created_at), ensure_ascii=False), export_form(title, content)
+
+@dataclass
+class Fragment:
+    """A rendered form of one thread, with its owner and HTTP validators."""
+    user_id: str
+    body: str
+    etag: str
+    last_modified: datetime
+    expires_at: float
+
+def make_etag(thread_id: str, form: str, body: str) -> str:
+    """Strong validator for one rendered form of a thread: a hash of its content."""
+    return hashlib.sha256(f"{thread_id}:{form}:{body}".encode("utf-8")).hexdigest()[:32]
+
+class FragmentCache:
+    """In-memory LRU of rendered thread fragments keyed by ``(thread_id, form)``.
+
+    Entries are dropped when their thread is updated or deleted in this
+    process; ``ttl_seconds`` bounds how long another process's change can
+    go unnoticed.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Fragment]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, thread_id: str, form: str) -> Optional[Fragment]:
+        key = (thread_id, form)
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None and fragment.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return fragment
+            if fragment is not None:
+                del self._entries[key]
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, thread_id: str, form: str, user_id: str, body: str, updated_at: str) -> Fragment:
+        """Cache ``body`` for a thread last updated at ``updated_at`` (ISO 8601) and return it."""
+        fragment = Fragment(
+            user_id=user_id,
+            body=body,
+            etag=make_etag(thread_id, form, body),
+            # HTTP dates have one-second resolution
+            last_modified=datetime.fromisoformat(updated_at).replace(microsecond=0),
+            expires_at=time.monotonic() + self.ttl_seconds
+        )
+        with self._lock:
+            self._entries[(thread_id, form)] = fragment
+            self._entries.move_to_end((thread_id, form))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def invalidate(self, thread_id: str):
+        """Drop every cached form of a thread."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == thread_id]:
+                del self._entries[key]
+            self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries)}
+
+fragment_cache = FragmentCache(
+    max_entries=int(os.getenv("FRAGMENT_CACHE_ENTRIES", 1024)),
+    ttl_seconds=float(os.getenv("FRAGMENT_CACHE_TTL", 300))
+)
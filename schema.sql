@@ -4,6 +4,8 @@ CREATE TABLE threads (
     user_id UUID REFERENCES auth.users(id) NOT NULL,
     title TEXT NOT NULL,
     content JSONB NOT NULL,
+    -- Lets history listings show post counts without selecting content
+    post_count INTEGER GENERATED ALWAYS AS (jsonb_array_length(content)) STORED,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
 );
@@ -11,6 +13,9 @@ CREATE TABLE threads (
 -- Create an index on user_id for faster queries
 CREATE INDEX idx_threads_user_id ON threads(user_id);
 
+-- Keyset pagination of a user's history, newest first
+CREATE INDEX idx_threads_user_created_id ON threads(user_id, created_at DESC, id DESC);
+
 -- Create a table for user configurations
 CREATE TABLE user_configs (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -21,6 +26,17 @@ CREATE TABLE user_configs (
     chunk_size INTEGER NOT NULL DEFAULT 2000,
     chunk_overlap INTEGER NOT NULL DEFAULT 100,
     max_chunks INTEGER NOT NULL DEFAULT 10,
+    chunk_selection TEXT NOT NULL DEFAULT 'salient' CHECK (chunk_selection IN ('salient', 'leading')),
+    title_token_budget INTEGER NOT NULL DEFAULT 400,
+    post_token_budget INTEGER NOT NULL DEFAULT 1500,
+    generation_mode TEXT NOT NULL DEFAULT 'standard' CHECK (generation_mode IN ('standard', 'map_reduce')),
+    map_reduce_max_chunks INTEGER NOT NULL DEFAULT 200,
+    map_concurrency INTEGER NOT NULL DEFAULT 8,
+    reduce_fan_in INTEGER NOT NULL DEFAULT 5,
+    posts_per_thread INTEGER NOT NULL DEFAULT 1,
+    post_concurrency INTEGER NOT NULL DEFAULT 4,
+    post_max_chars INTEGER NOT NULL DEFAULT 280,
+    post_retries INTEGER NOT NULL DEFAULT 2,
     prompts JSONB NOT NULL DEFAULT '{"title": "Summarize the following content into a thread title that would grab attention on X (formerly Twitter): {content}", "thread": "Create a single engaging thread post from this content. Format it as a thread with line breaks between key points, use emojis where appropriate, and make it conversational: {content}"}',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
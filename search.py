@@ -0,0 +1,98 @@
+"""Full-text search over generated threads using a SQLite FTS5 index."""
+import math
+import re
+from typing import Any, Dict, Iterable, Optional
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+
+# Private-use markers survive FTS5 snippet() and HTML escaping untouched
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+def _user_token(user_id: str) -> str:
+    # One indexed token per user so the owner filter runs inside the FTS query
+    return "u" + re.sub(r"\W", "", user_id or "")
+
+def create_index(conn):
+    """Create the FTS5 table; rowid is the local thread.id."""
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS thread_fts USING fts5("
+        "title, body, owner, thread_id UNINDEXED, created_at UNINDEXED, "
+        "tokenize='porter unicode61')"
+    ))
+
+def index_thread(conn, rowid: int, thread_id: str, user_id: str, title: str, posts: Iterable[str], created_at: Optional[str]):
+    """Add or replace one thread in the index."""
+    conn.execute(text("DELETE FROM thread_fts WHERE rowid = :rowid"), {"rowid": rowid})
+    conn.execute(
+        text(
+            "INSERT INTO thread_fts (rowid, title, body, owner, thread_id, created_at) "
+            "VALUES (:rowid, :title, :body, :owner, :thread_id, :created_at)"
+        ),
+        {
+            "rowid": rowid,
+            "title": title,
+            "body": "\n\n".join(posts),
+            "thread_id": thread_id,
+            "owner": _user_token(user_id),
+            "created_at": created_at,
+        }
+    )
+
+def remove_thread(conn, rowid: int):
+    conn.execute(text("DELETE FROM thread_fts WHERE rowid = :rowid"), {"rowid": rowid})
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query: every term must match, the last as a prefix."""
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def _highlight(snippet: str) -> Markup:
+    return Markup(str(escape(snippet)).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>"))
+
+def search_threads(conn, user_id: str, query: str, page: int = 1, per_page: int = 10) -> Dict[str, Any]:
+    """Return one page of a user's threads ranked by BM25, with highlighted snippets."""
+    page = max(page, 1)
+    match = build_match_query(query)
+    if match is None:
+        return {"results": [], "total": 0, "page": page, "pages": 0}
+
+    params = {"match": f'owner : "{_user_token(user_id)}" AND ({match})'}
+    total = conn.execute(
+        text("SELECT count(*) FROM thread_fts WHERE thread_fts MATCH :match"),
+        params
+    ).scalar()
+    rows = conn.execute(
+        text(
+            "SELECT thread_id, created_at, "
+            f"highlight(thread_fts, 0, '{_MARK_START}', '{_MARK_END}') AS title, "
+            f"snippet(thread_fts, 1, '{_MARK_START}', '{_MARK_END}', '…', 16) AS snippet, "
+            "bm25(thread_fts, 10.0, 1.0, 0.0) AS rank "
+            "FROM thread_fts WHERE thread_fts MATCH :match "
+            "ORDER BY rank LIMIT :limit OFFSET :offset"
+        ),
+        {**params, "limit": per_page, "offset": (page - 1) * per_page}
+    ).fetchall()
+
+    return {
+        "results": [
+            {
+                "id": row.thread_id,
+                "title": _highlight(row.title),
+                "created_at": row.created_at,
+                "snippet": _highlight(row.snippet),
+                "score": -row.rank,
+            }
+            for row in rows
+        ],
+        "total": total,
+        "page": page,
+        "pages": math.ceil(total / per_page) if total else 0,
+    }
@@ -0,0 +1,122 @@
+"""Token-budgeted chunk selection for generation prompts.
+
+Chunks are ranked by BM25-weighted cosine similarity to the document's
+centroid, so the passages most representative of the whole document go
+first and front matter that shares little vocabulary with the rest (tables
+of contents, legal boilerplate) sinks. Near-duplicates of an already
+selected chunk are skipped. Everything runs locally with NumPy and the
+model's tiktoken encoding.
+"""
+import logging
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import numpy as np
+import tiktoken
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Chunks this similar to a selected one are treated as repeated boilerplate
+DUPLICATE_SIMILARITY = 0.9
+# Terms kept for scoring, by document frequency; bounds the dense matrix
+MAX_TERMS = 4096
+
+# Estimate used when no tiktoken encoding can be loaded
+CHARS_PER_TOKEN = 4
+
+logger = logging.getLogger(__name__)
+
+_TERM_RE = re.compile(r"\w{2,}", re.UNICODE)
+
+@lru_cache(maxsize=None)
+def _encoding(model_name: str) -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use; offline hosts fall back to an estimate
+        logger.warning("No tiktoken encoding for %s, estimating tokens: %s", model_name, e)
+        return None
+
+def count_tokens(text: str, model_name: str) -> int:
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int, model_name: str) -> str:
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+def chunk_vectors(texts: Sequence[str]) -> np.ndarray:
+    """L2-normalized BM25 term weights, one row per text, over the MAX_TERMS most widespread terms."""
+    terms = [_TERM_RE.findall(text.lower()) for text in texts]
+    spread = Counter(term for chunk_terms in terms for term in set(chunk_terms))
+    vocabulary = {term: column for column, (term, _) in enumerate(spread.most_common(MAX_TERMS))}
+    rows, columns = [], []
+    for row, chunk_terms in enumerate(terms):
+        for term in chunk_terms:
+            column = vocabulary.get(term)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+
+    counts = np.zeros((len(texts), max(len(vocabulary), 1)), dtype=np.float32)
+    np.add.at(counts, (rows, columns), 1)
+
+    lengths = counts.sum(axis=1, keepdims=True)
+    average_length = lengths.mean() or 1.0
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log1p((len(texts) - document_frequency + 0.5) / (document_frequency + 0.5))
+    saturation = counts * (BM25_K1 + 1) / (counts + BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length))
+    weights = saturation * idf
+
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    return weights / np.where(norms == 0, 1, norms)
+
+def salience(vectors: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each row to the centroid of all rows."""
+    centroid = vectors.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    return vectors @ (centroid / norm) if norm else np.zeros(len(vectors))
+
+def select_chunks(texts: Sequence[str], budget: int, model_name: str, rank: bool = True) -> List[int]:
+    """Indexes of the chunks to put in a prompt of at most ``budget`` tokens, in document order.
+
+    With ``rank`` the most salient chunks are packed first and near-duplicates
+    dropped; without it chunks are packed in order until one no longer fits.
+    At least one chunk is always returned (truncate it with
+    ``truncate_tokens`` if it alone exceeds the budget).
+    """
+    if not texts:
+        return []
+    sizes = [count_tokens(text, model_name) for text in texts]
+    if not rank:
+        selected, used = [], 0
+        for index, size in enumerate(sizes):
+            if used + size > budget and selected:
+                break
+            selected.append(index)
+            used += size
+        return selected
+
+    vectors = chunk_vectors(texts)
+    order = np.argsort(-salience(vectors), kind="stable")
+    selected, used = [], 0
+    for index in order:
+        if used + sizes[index] > budget and selected:
+            continue
+        if selected and (vectors[selected] @ vectors[index]).max() >= DUPLICATE_SIMILARITY:
+            continue
+        selected.append(int(index))
+        used += sizes[index]
+        if used >= budget:
+            break
+    return sorted(selected)
@@ -2,6 +2,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const uploadArea = document.getElementById('uploadArea');
     const fileInput = document.getElementById('fileInput');
     const progressIndicator = document.getElementById('progressIndicator');
+    const progressStage = document.getElementById('progressStage');
+    const streamToggle = document.getElementById('streamToggle');
+    const streamPreview = document.getElementById('streamPreview');
+    const streamTitle = document.getElementById('streamTitle');
+    const streamPost = document.getElementById('streamPost');
+    const batchResults = document.getElementById('batchResults');
     
     if (uploadArea) {
         uploadArea.addEventListener('click', () => {
@@ -21,39 +27,269 @@ document.addEventListener('DOMContentLoaded', function() {
             e.preventDefault();
             uploadArea.classList.remove('border-primary');
             
-            const files = e.dataTransfer.files;
-            if (files.length) {
-                handleFile(files[0]);
-            }
+            handleFiles(e.dataTransfer.files);
         });
         
         fileInput.addEventListener('change', (e) => {
-            if (e.target.files.length) {
-                handleFile(e.target.files[0]);
-            }
+            handleFiles(e.target.files);
         });
         
-        function handleFile(file) {
+        function handleFiles(files) {
+            if (files.length > 1) {
+                handleBatch(files);
+            } else if (files.length) {
+                handleFile(files[0]);
+            }
+        }
+        
+        const stageLabels = {
+            queued: 'Waiting in queue...',
+            parsing: 'Reading your document...',
+            splitting: 'Splitting content...',
+            summarizing: 'Summarizing the whole document...',
+            title: 'Writing the thread title...',
+            outline: 'Planning the thread...',
+            post: 'Writing the thread posts...',
+            generating: 'Writing your threads...',
+            saving: 'Saving your thread...',
+            done: 'Done!'
+        };
+        
+        function showStage(stage) {
+            progressStage.textContent = stageLabels[stage] || 'AI is processing your document...';
+        }
+        
+        function pollJob(jobId) {
+            return fetch(`/jobs/${jobId}`)
+                .then(response => response.json())
+                .then(job => {
+                    if (job.error && !job.status) {
+                        throw new Error(job.error);
+                    }
+                    showStage(job.stage);
+                    if (job.status === 'succeeded') {
+                        return job.result;
+                    }
+                    if (job.status === 'failed') {
+                        throw new Error(job.error || 'An error occurred');
+                    }
+                    return new Promise(resolve => setTimeout(resolve, 1000))
+                        .then(() => pollJob(jobId));
+                });
+        }
+        
+        // Open the existing thread for a near-duplicate upload, or return regenerate() if the user declines
+        function offerDuplicate(result, regenerate) {
+            const changed = result.changed_chunks.length;
+            const message = `This document is ${Math.round(result.similarity * 100)}% similar to one you already ` +
+                `turned into a thread (${changed} of ${result.total_chunks} sections changed).\n\n` +
+                'OK opens the existing thread; Cancel generates a new one.';
+            if (confirm(message)) {
+                window.location.href = `/thread/${result.duplicate_of}`;
+                return null;
+            }
+            return regenerate();
+        }
+        
+        function parseEvent(raw) {
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    event = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
+            });
+            return { event, data: JSON.parse(data) };
+        }
+        
+        // Returns the final result on 'done', null while the stream continues
+        function handleEvent(message) {
+            switch (message.event) {
+                case 'stage':
+                    showStage(message.data);
+                    break;
+                case 'title':
+                    showStage('title');
+                    streamPreview.classList.add('active');
+                    streamTitle.textContent += message.data;
+                    break;
+                case 'post':
+                    showStage('post');
+                    streamPost.textContent += message.data;
+                    break;
+                case 'error':
+                    throw new Error(message.data);
+                case 'duplicate':
+                case 'done':
+                    return message.data;
+            }
+            return null;
+        }
+        
+        function streamFile(file, regenerate) {
             const formData = new FormData();
             formData.append('file', file);
+            if (regenerate) {
+                formData.append('duplicates', 'regenerate');
+            }
             
+            streamTitle.textContent = '';
+            streamPost.textContent = '';
+            streamPreview.classList.remove('active');
+            showStage('parsing');
             progressIndicator.classList.add('active');
             
-            fetch('/upload', {
+            return fetch('/upload/stream', {
+                method: 'POST',
+                body: formData
+            })
+            .then(response => {
+                if (!response.ok) {
+                    return response.json().then(data => {
+                        throw new Error(data.error || 'An error occurred');
+                    });
+                }
+                
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                
+                function read() {
+                    return reader.read().then(({ done, value }) => {
+                        if (done) {
+                            throw new Error('The connection closed before the thread was saved');
+                        }
+                        buffer += decoder.decode(value, { stream: true });
+                        
+                        let boundary;
+                        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                            const result = handleEvent(parseEvent(buffer.slice(0, boundary)));
+                            buffer = buffer.slice(boundary + 2);
+                            if (result) {
+                                return result;
+                            }
+                        }
+                        return read();
+                    });
+                }
+                
+                return read();
+            })
+            .then(result => {
+                if (result.duplicate_of) {
+                    return offerDuplicate(result, () => streamFile(file, true));
+                }
+                window.location.href = `/thread/${result.thread_id}`;
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                alert(error.message || 'An error occurred while processing the file');
+            })
+            .finally(() => {
+                progressIndicator.classList.remove('active');
+            });
+        }
+        
+        function showBatchResults(entries) {
+            batchResults.innerHTML = '';
+            entries.forEach(entry => {
+                const item = document.createElement('li');
+                item.className = 'list-group-item d-flex justify-content-between align-items-center';
+                const name = document.createElement('span');
+                name.textContent = entry.filename;
+                item.appendChild(name);
+                if (entry.status === 'succeeded') {
+                    const link = document.createElement('a');
+                    link.href = `/thread/${entry.thread_id}`;
+                    link.className = 'btn btn-sm btn-primary';
+                    link.textContent = 'View thread';
+                    item.appendChild(link);
+                } else if (entry.status === 'duplicate') {
+                    const link = document.createElement('a');
+                    link.href = `/thread/${entry.thread_id}`;
+                    link.className = 'btn btn-sm btn-outline-secondary';
+                    link.textContent = 'Already a thread';
+                    item.appendChild(link);
+                } else {
+                    const error = document.createElement('small');
+                    error.className = 'text-danger';
+                    error.textContent = entry.error || 'Failed';
+                    item.appendChild(error);
+                }
+                batchResults.appendChild(item);
+            });
+            batchResults.classList.remove('d-none');
+        }
+        
+        function handleBatch(files) {
+            const formData = new FormData();
+            Array.from(files).forEach(file => formData.append('files', file));
+            
+            let rejected = [];
+            batchResults.classList.add('d-none');
+            showStage('queued');
+            progressIndicator.classList.add('active');
+            
+            fetch('/upload/batch', {
                 method: 'POST',
                 body: formData
             })
             .then(response => response.json())
             .then(data => {
-                if (data.success) {
-                    window.location.href = `/thread/${data.thread_id}`;
-                } else {
-                    alert(data.error || 'An error occurred');
+                if (!data.success) {
+                    throw new Error(data.error || 'An error occurred');
+                }
+                rejected = data.rejected || [];
+                return pollJob(data.job_id);
+            })
+            .then(result => {
+                showBatchResults(result.threads.concat(rejected));
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                alert(error.message || 'An error occurred while processing the files');
+            })
+            .finally(() => {
+                progressIndicator.classList.remove('active');
+            });
+        }
+        
+        function handleFile(file, regenerate) {
+            if (streamToggle && streamToggle.checked) {
+                return streamFile(file, regenerate);
+            }
+            
+            const formData = new FormData();
+            formData.append('file', file);
+            if (regenerate) {
+                formData.append('duplicates', 'regenerate');
+            }
+            
+            showStage('queued');
+            progressIndicator.classList.add('active');
+            
+            return fetch('/upload', {
+                method: 'POST',
+                body: formData
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.error || 'An error occurred');
+                }
+                return pollJob(data.job_id);
+            })
+            .then(result => {
+                if (result.duplicate_of) {
+                    return offerDuplicate(result, () => handleFile(file, true));
                 }
+                window.location.href = `/thread/${result.thread_id}`;
             })
             .catch(error => {
                 console.error('Error:', error);
-                alert('An error occurred while processing the file');
+                alert(error.message || 'An error occurred while processing the file');
             })
             .finally(() => {
                 progressIndicator.classList.remove('active');
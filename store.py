@@ -0,0 +1,484 @@
+"""Local thread store: SQLite read-through cache with write-behind to Supabase."""
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, or_, text
+
+from models import db, Thread, ThreadPost
+import dedup
+import metrics
+import rendering
+import search
+import supabase_client
+
+logger = logging.getLogger(__name__)
+
+# Threads listed per Supabase request when copying a user's threads into the local store
+BACKFILL_PAGE_SIZE = 100
+
+# Columns added to the original thread/thread_post tables, created in place on startup
+_ADDED_COLUMNS = {
+    'thread': {
+        'remote_id': 'VARCHAR(36)',
+        'user_id': 'VARCHAR(36)',
+        'updated_at': 'DATETIME',
+        'synced': 'BOOLEAN',
+        'sync_attempts': 'INTEGER DEFAULT 0',
+        'next_sync_at': 'DATETIME',
+        'sync_error': 'TEXT',
+        'display_json': 'TEXT',
+        'export_text': 'TEXT',
+    },
+    'thread_post': {
+        'position': 'INTEGER DEFAULT 0',
+    },
+}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() + '+00:00' if value else None
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    # Supabase returns UTC timestamps; the local tables store naive UTC
+    return datetime.fromisoformat(value).replace(tzinfo=None) if value else None
+
+def rendered_to_dict(thread: Thread) -> dict:
+    """A thread's precomputed display and export forms, without its posts."""
+    return {
+        'id': thread.remote_id,
+        'user_id': thread.user_id,
+        'updated_at': _isoformat(thread.updated_at or thread.created_at),
+        'display': json.loads(thread.display_json),
+        'export': thread.export_text,
+    }
+
+# Columns whose change alters what the thread routes serve; sync state is not among them
+_CONTENT_COLUMNS = ('title', 'updated_at', 'display_json', 'export_text')
+
+def _invalidate_fragments(mapper, connection, thread: Thread):
+    rendering.fragment_cache.invalidate(thread.remote_id)
+
+def _invalidate_changed_fragments(mapper, connection, thread: Thread):
+    state = inspect(thread)
+    if any(state.attrs[name].history.has_changes() for name in _CONTENT_COLUMNS):
+        rendering.fragment_cache.invalidate(thread.remote_id)
+
+def history_key(row: dict) -> tuple:
+    """Newest-first sort key of a history row, comparable across local and Supabase timestamps."""
+    return _parse_timestamp(row['created_at']), row['id']
+
+def thread_to_dict(thread: Thread) -> dict:
+    """Shape a local thread like a Supabase ``threads`` row."""
+    return {
+        'id': thread.remote_id,
+        'user_id': thread.user_id,
+        'title': thread.title,
+        'content': [post.content for post in thread.posts],
+        'created_at': _isoformat(thread.created_at),
+        'updated_at': _isoformat(thread.updated_at or thread.created_at),
+    }
+
+class ThreadStore:
+    """Serve thread reads from SQLite and flush writes to Supabase in the background.
+
+    Saves are committed locally and marked unsynced; a flusher thread pushes
+    them to Supabase with exponential backoff. Because pending rows live in
+    the database, writes that have not reached Supabase survive restarts.
+    Reads hit SQLite first and fall back to Supabase, caching the result.
+    Search only sees local rows, so ``backfill_user`` copies the rest of a
+    user's threads in from Supabase.
+    """
+
+    def __init__(self, app=None, flush_interval: float = 5, max_backoff: float = 300, batch_size: int = 50):
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.batch_size = batch_size
+        self.app = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._backfilled = set()
+        self._backfill_locks: Dict[str, threading.Lock] = {}
+        self._backfill_locks_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, start_flusher: bool = True):
+        self.app = app
+        with app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+                db.engine.dispose()
+            db.create_all()
+            self._add_missing_columns()
+            self._create_search_index()
+            self._backfill_rendered()
+            with db.engine.begin() as conn:
+                dedup.create_index(conn)
+        if start_flusher:
+            self.start()
+
+    def _add_missing_columns(self):
+        inspector = inspect(db.engine)
+        with db.engine.begin() as conn:
+            for table, columns in _ADDED_COLUMNS.items():
+                existing = {column['name'] for column in inspector.get_columns(table)}
+                for name, ddl in columns.items():
+                    if name not in existing:
+                        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+            conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_thread_remote_id ON thread (remote_id)'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_thread_user_id ON thread (user_id)'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_thread_synced ON thread (synced)'))
+
+    def _create_search_index(self):
+        with db.engine.begin() as conn:
+            search.create_index(conn)
+        # Backfill threads stored before the index existed
+        if db.session.execute(text('SELECT count(*) FROM thread_fts')).scalar() == 0:
+            for thread in Thread.query.filter(Thread.remote_id.isnot(None)):
+                self._index(thread)
+            db.session.commit()
+
+    def _backfill_rendered(self):
+        # Threads stored before the forms were precomputed, or with an older display form
+        outdated = or_(
+            Thread.export_text.is_(None),
+            func.coalesce(func.json_extract(Thread.display_json, '$.version'), 0) != rendering.DISPLAY_VERSION
+        )
+        for thread in Thread.query.filter(outdated):
+            self._render(thread, [post.content for post in thread.posts])
+        db.session.commit()
+
+    @staticmethod
+    def _render(thread: Thread, content: list):
+        thread.display_json, thread.export_text = rendering.render_thread(thread.title, content, thread.created_at)
+
+    def _index(self, thread: Thread):
+        search.index_thread(
+            db.session,
+            thread.id,
+            thread.remote_id,
+            thread.user_id,
+            thread.title,
+            [post.content for post in thread.posts],
+            _isoformat(thread.created_at)
+        )
+
+    # Writes
+
+    def _new_thread(self, user_id: str, title: str, content: list, thread_id: Optional[str] = None,
+                    synced: bool = False, created_at: Optional[datetime] = None,
+                    updated_at: Optional[datetime] = None,
+                    fingerprint: Optional[dedup.Fingerprint] = None) -> Thread:
+        now = datetime.utcnow()
+        thread = Thread(
+            remote_id=thread_id or str(uuid.uuid4()),
+            user_id=user_id,
+            title=title,
+            created_at=created_at or now,
+            updated_at=updated_at or created_at or now,
+            synced=synced,
+            sync_attempts=0,
+            next_sync_at=now
+        )
+        thread.posts = [ThreadPost(position=i, content=post) for i, post in enumerate(content)]
+        self._render(thread, content)
+        db.session.add(thread)
+        # Flush for the primary key, then index in the same transaction
+        db.session.flush()
+        self._index(thread)
+        if fingerprint is not None:
+            dedup.index_document(db.session, user_id, thread.remote_id, fingerprint, _isoformat(thread.created_at))
+        return thread
+
+    def save_thread(self, user_id: str, title: str, content: list,
+                    fingerprint: Optional[dedup.Fingerprint] = None) -> Tuple[Optional[dict], Optional[str]]:
+        """Save a thread locally and queue it for Supabase.
+
+        With ``fingerprint``, the source document is indexed for near-duplicate lookups.
+        """
+        try:
+            with metrics.timed("store_save"), self.app.app_context():
+                thread = self._new_thread(user_id, title, content, fingerprint=fingerprint)
+                db.session.commit()
+                row = thread_to_dict(thread)
+            self._wake.set()
+            return row, None
+        except Exception as e:
+            return None, str(e)
+
+    def save_threads(self, user_id: str, threads: list,
+                     fingerprints: Optional[list] = None) -> Tuple[Optional[List[dict]], Optional[str]]:
+        """Save several ``(title, content)`` threads in one local transaction.
+
+        ``fingerprints``, if given, holds one fingerprint (or None) per thread.
+        """
+        try:
+            with metrics.timed("store_save"), self.app.app_context():
+                created = [
+                    self._new_thread(user_id, title, content, fingerprint=fingerprint)
+                    for (title, content), fingerprint in zip(threads, fingerprints or [None] * len(threads))
+                ]
+                db.session.commit()
+                rows = [thread_to_dict(thread) for thread in created]
+            self._wake.set()
+            return rows, None
+        except Exception as e:
+            return None, str(e)
+
+    def delete_thread(self, thread_id: str, user_id: str) -> Tuple[bool, Optional[str]]:
+        """Delete a thread locally and in Supabase."""
+        with self.app.app_context():
+            thread = Thread.query.filter_by(remote_id=thread_id, user_id=user_id).first()
+            if thread is not None:
+                search.remove_thread(db.session, thread.id)
+                dedup.remove_document(db.session, thread_id)
+                db.session.delete(thread)
+                db.session.commit()
+        # Also covers threads only held remotely
+        rendering.fragment_cache.invalidate(thread_id)
+        return supabase_client.run_sync(supabase_client.delete_thread(thread_id, user_id))
+
+    # Reads
+
+    def _get_local(self, thread_id: str) -> Optional[dict]:
+        with self.app.app_context():
+            thread = Thread.query.filter_by(remote_id=thread_id).first()
+            return thread_to_dict(thread) if thread is not None else None
+
+    def _cache_remote(self, thread_id: str, row: dict) -> bool:
+        try:
+            with self.app.app_context():
+                self._new_thread(
+                    row['user_id'], row['title'], row['content'], row['id'], synced=True,
+                    created_at=_parse_timestamp(row.get('created_at')),
+                    updated_at=_parse_timestamp(row.get('updated_at'))
+                )
+                db.session.commit()
+            return True
+        except Exception as e:
+            # A concurrent read may have cached it first; the remote row is still valid
+            logger.debug("Could not cache thread %s: %s", thread_id, e)
+            return False
+
+    def get_thread(self, thread_id: str) -> Tuple[Optional[dict], Optional[str]]:
+        """Get a thread from SQLite, fetching it from Supabase on a miss."""
+        row = self._get_local(thread_id)
+        if row is not None:
+            return row, None
+
+        row, error = supabase_client.run_sync(supabase_client.get_thread(thread_id))
+        if error or not row:
+            return row, error
+        self._cache_remote(thread_id, row)
+        return row, None
+
+    async def aget_thread(self, thread_id: str) -> Tuple[Optional[dict], Optional[str]]:
+        """Async get_thread: the Supabase fallback is awaited rather than blocking."""
+        row = self._get_local(thread_id)
+        if row is not None:
+            return row, None
+
+        row, error = await supabase_client.get_thread(thread_id)
+        if error or not row:
+            return row, error
+        self._cache_remote(thread_id, row)
+        return row, None
+
+    def _get_rendered_local(self, thread_id: str) -> Optional[dict]:
+        with self.app.app_context():
+            thread = Thread.query.filter_by(remote_id=thread_id).first()
+            return rendered_to_dict(thread) if thread is not None else None
+
+    async def aget_rendered(self, thread_id: str) -> Tuple[Optional[dict], Optional[str]]:
+        """Like ``aget_thread`` but return the precomputed display and export forms (see ``rendered_to_dict``)."""
+        rendered = self._get_rendered_local(thread_id)
+        if rendered is not None:
+            return rendered, None
+
+        row, error = await self.aget_thread(thread_id)
+        if error or not row:
+            return row, error
+        # The fetched row was cached locally, forms included; if that failed, build them here
+        rendered = self._get_rendered_local(thread_id)
+        if rendered is None:
+            display_json, export_text = rendering.render_thread(
+                row['title'], row['content'], _parse_timestamp(row.get('created_at'))
+            )
+            rendered = {
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'updated_at': row.get('updated_at') or row.get('created_at'),
+                'display': json.loads(display_json),
+                'export': export_text,
+            }
+        return rendered, None
+
+    def unsynced_summaries(self, user_id: str, before: Optional[Tuple[str, str]] = None, limit: int = 20) -> List[dict]:
+        """Up to ``limit`` history rows of a user's threads not yet in Supabase, newest first.
+
+        ``before`` is a ``(created_at, id)`` keyset position; only rows after
+        it in newest-first order are returned. Rows have the summary columns
+        of ``get_user_threads_page``.
+        """
+        with self.app.app_context():
+            query = Thread.query.filter(Thread.user_id == user_id, Thread.synced == False)  # noqa: E712
+            if before is not None:
+                query = query.filter(Thread.created_at <= _parse_timestamp(before[0]))
+            rows = [
+                {
+                    'id': thread.remote_id,
+                    'title': thread.title,
+                    'created_at': _isoformat(thread.created_at),
+                    'post_count': len(thread.posts),
+                }
+                for thread in query.order_by(Thread.created_at.desc(), Thread.remote_id.desc()).limit(limit + 1)
+            ]
+        if before is not None:
+            position = history_key({'created_at': before[0], 'id': before[1]})
+            rows = [row for row in rows if history_key(row) < position]
+        return rows[:limit]
+
+    def find_similar(self, user_id: str, fingerprint: dedup.Fingerprint, threshold: float) -> Optional[dedup.Match]:
+        """The user's indexed document most similar to ``fingerprint``, if any reaches ``threshold``."""
+        with metrics.timed("dedup_lookup"), self.app.app_context():
+            return dedup.find_similar(db.session, user_id, fingerprint, threshold)
+
+    def search(self, user_id: str, query: str, page: int = 1, per_page: int = 10) -> dict:
+        """Ranked full-text search over a user's threads, backfilling them from Supabase first if needed."""
+        self.backfill_user(user_id)
+        with self.app.app_context():
+            return search.search_threads(db.session, user_id, query, page, per_page)
+
+    # Backfill
+
+    def backfill_user(self, user_id: str) -> int:
+        """Copy a user's Supabase threads that are not stored locally into the store and search index.
+
+        Runs once per user and process; later calls return at once, or wait
+        for a backfill in progress. A failed backfill is retried on the next
+        call. Returns how many threads were added.
+        """
+        with self._backfill_locks_lock:
+            lock = self._backfill_locks.setdefault(user_id, threading.Lock())
+        with lock:
+            if user_id in self._backfilled:
+                return 0
+            added, error = self._backfill_pages(user_id)
+            if error:
+                logger.warning("Backfill of threads for user %s stopped after %d: %s", user_id, added, error)
+            else:
+                self._backfilled.add(user_id)
+            return added
+
+    def _backfill_pages(self, user_id: str) -> Tuple[int, Optional[str]]:
+        added = 0
+        cursor = None
+        while True:
+            # Page summaries, then fetch only the threads missing here
+            page, error = supabase_client.run_sync(
+                supabase_client.get_user_threads_page(user_id, BACKFILL_PAGE_SIZE, cursor)
+            )
+            if error:
+                return added, error
+            ids = [row['id'] for row in page['threads']]
+            with self.app.app_context():
+                known = {remote_id for (remote_id,) in db.session.query(Thread.remote_id).filter(Thread.remote_id.in_(ids))}
+            missing = [thread_id for thread_id in ids if thread_id not in known]
+            if missing:
+                rows, error = supabase_client.run_sync(supabase_client.get_threads(missing))
+                if error:
+                    return added, error
+                added += sum(self._cache_remote(row['id'], row) for row in rows or [])
+            cursor = page['next_cursor']
+            if not cursor:
+                return added, None
+
+    # Write-behind
+
+    def start(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stopped.clear()
+            self._flusher = threading.Thread(target=self._run_flusher, name='thread-store-flusher', daemon=True)
+            self._flusher.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join()
+
+    def _run_flusher(self):
+        while not self._stopped.is_set():
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Thread flush failed: %s", e)
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+    def flush(self) -> int:
+        """Push due, unsynced threads to Supabase. Returns how many were synced."""
+        synced = 0
+        with self.app.app_context():
+            pending = (
+                Thread.query
+                .filter(Thread.synced == False, Thread.next_sync_at <= datetime.utcnow())  # noqa: E712
+                .order_by(Thread.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not pending:
+                return 0
+            errors = self._push([
+                {
+                    'id': thread.remote_id,
+                    'user_id': thread.user_id,
+                    'title': thread.title,
+                    'content': [post.content for post in thread.posts],
+                    'created_at': _isoformat(thread.created_at),
+                }
+                for thread in pending
+            ])
+            for thread in pending:
+                error = errors.get(thread.remote_id)
+                if error:
+                    thread.sync_attempts = (thread.sync_attempts or 0) + 1
+                    delay = min(self.max_backoff, 2 ** thread.sync_attempts)
+                    thread.next_sync_at = datetime.utcnow() + timedelta(seconds=delay)
+                    thread.sync_error = error
+                else:
+                    thread.synced = True
+                    thread.sync_error = None
+                    synced += 1
+            db.session.commit()
+        return synced
+
+    def _push(self, rows: List[dict]) -> Dict[str, str]:
+        """Upsert ``rows`` in one call, halving a failed batch so one bad row cannot hold back the rest.
+
+        Returns the error of each row that could not be synced, by id.
+        """
+        _, error = supabase_client.run_sync(supabase_client.upsert_threads(rows))
+        if not error:
+            return {}
+        if len(rows) == 1:
+            return {rows[0]['id']: str(error)}
+        middle = len(rows) // 2
+        return {**self._push(rows[:middle]), **self._push(rows[middle:])}
+
+# Rendered fragments go stale when a thread's content changes or it is deleted
+event.listen(Thread, 'after_update', _invalidate_changed_fragments)
+event.listen(Thread, 'after_delete', _invalidate_fragments)
+
+thread_store = ThreadStore()
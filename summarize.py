@@ -0,0 +1,82 @@
+"""Map-reduce summarization for documents longer than a single prompt."""
+from typing import List
+
+from config import AIConfig
+from llm_cache import llm_cache
+from llm_clients import get_prompt
+import metrics
+
+DEFAULT_SUMMARIZE_PROMPT = (
+    "Summarize the following section of a document. Keep every key fact, figure "
+    "and conclusion, and leave out filler: {content}"
+)
+DEFAULT_COMBINE_PROMPT = (
+    "Combine these partial summaries of one document into a single summary, in "
+    "document order, without dropping key points: {content}"
+)
+
+def _template(config: AIConfig, name: str, default: str):
+    return get_prompt(config.prompts.get(name) or default)
+
+async def _abatch_cached(chain, prompts: List[str], config: AIConfig, use_cache: bool) -> List[str]:
+    """Run ``prompts`` through ``chain.abatch``, skipping cached responses.
+
+    At most ``map_concurrency`` calls are in flight. The key covers the
+    rendered prompt, so an unchanged chunk is served from the cache even
+    when other parts of the document changed.
+    """
+    keys = [llm_cache.make_key(prompt, config.model_name, config.temperature, config.max_tokens) for prompt in prompts]
+    results = [llm_cache.get(key) if use_cache else None for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+    for _ in range(len(prompts) - len(pending)):
+        metrics.observe_llm_call(config.model_name, "hit")
+    if not pending:
+        return results
+
+    # Each call is rate limited, retried and timed out by the scheduled chain
+    outputs = await chain.abatch(
+        [prompts[i] for i in pending],
+        config={"max_concurrency": config.map_concurrency}
+    )
+
+    for i, output in zip(pending, outputs):
+        metrics.observe_llm_call(config.model_name, "miss" if use_cache else "bypass")
+        results[i] = output
+        llm_cache.set(keys[i], output)
+    return results
+
+async def asummarize(chain, texts: List[str], config: AIConfig, budget: int, use_cache: bool = True) -> str:
+    """Reduce ``texts`` to at most ``budget`` characters of summary.
+
+    Map: every text is summarized independently. Reduce: summaries are
+    combined ``reduce_fan_in`` at a time, level by level, until the joined
+    result fits the budget or a single summary remains. Texts that already
+    fit are returned unchanged without any LLM call.
+    """
+    joined = "\n\n".join(texts)
+    if len(joined) <= budget:
+        return joined
+
+    summarize_prompt = _template(config, "summarize", DEFAULT_SUMMARIZE_PROMPT)
+    summaries = await _abatch_cached(
+        chain,
+        [summarize_prompt.format(content=text) for text in texts],
+        config,
+        use_cache
+    )
+
+    combine_prompt = _template(config, "combine", DEFAULT_COMBINE_PROMPT)
+    fan_in = config.reduce_fan_in
+    while len(summaries) > 1 and len("\n\n".join(summaries)) > budget:
+        groups = [summaries[i:i + fan_in] for i in range(0, len(summaries), fan_in)]
+        combined = await _abatch_cached(
+            chain,
+            [combine_prompt.format(content="\n\n".join(group)) for group in groups if len(group) > 1],
+            config,
+            use_cache
+        )
+        # A trailing group of one has nothing to combine and moves up as-is
+        if len(groups[-1]) == 1:
+            combined.append(groups[-1][0])
+        summaries = combined
+    return "\n\n".join(summaries)
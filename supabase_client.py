@@ -1,20 +1,134 @@
-from supabase import create_client
+"""Async Supabase data layer.
+
+Every call runs on one background event loop that owns the async Supabase
+client and its pooled keep-alive HTTP connections. The public coroutines
+can be awaited from any event loop (async views, job workers), so callers
+can run several at once with ``asyncio.gather``; synchronous code uses
+``run_sync``.
+"""
 from dotenv import load_dotenv
+import asyncio
+import base64
+import functools
+import httpx
+import json
+import logging
 import os
+import threading
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+
+from metrics import track_supabase
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_ANON_KEY")
-)
+class _BackgroundLoop:
+    """An event loop running on a daemon thread, started on first use."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+_background = _BackgroundLoop("supabase-loop")
+_client: Optional["AsyncClient"] = None
+_client_lock: Optional[asyncio.Lock] = None
+_call_slots: Optional[asyncio.Semaphore] = None
+
+# httpcore matches every queued request against every pooled connection on
+# each pool event, so calls past this limit wait on a cheap semaphore instead
+MAX_CONCURRENT_CALLS = int(os.getenv("SUPABASE_MAX_CONCURRENT_CALLS", 16))
+
+def _create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", MAX_CONCURRENT_CALLS)),
+            # Keep every connection the call limit can use, or they churn under load
+            max_keepalive_connections=int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", MAX_CONCURRENT_CALLS)),
+            keepalive_expiry=float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", 30))
+        ),
+        timeout=float(os.getenv("SUPABASE_TIMEOUT", 30))
+    )
 
+async def _get_client() -> "AsyncClient":
+    """Return the shared async client, creating it on the background loop."""
+    global _client, _client_lock
+    if _client is None:
+        # supabase pulls in its auth, storage and realtime clients; load them on first use
+        from supabase import AsyncClientOptions, acreate_client
+
+        if _client_lock is None:
+            _client_lock = asyncio.Lock()
+        async with _client_lock:
+            if _client is None:
+                _client = await acreate_client(
+                    os.getenv("SUPABASE_URL"),
+                    os.getenv("SUPABASE_ANON_KEY"),
+                    options=AsyncClientOptions(httpx_client=_create_http_client())
+                )
+    return _client
+
+async def _limited(coro):
+    """Await ``coro`` holding one of MAX_CONCURRENT_CALLS slots on the background loop."""
+    global _call_slots
+    if _call_slots is None:
+        _call_slots = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+    async with _call_slots:
+        return await coro
+
+def _on_background_loop(fn):
+    """Run the wrapped coroutine on the background loop, awaitable from any loop."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        loop = _background.loop
+        coro = _limited(fn(*args, **kwargs))
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+    return wrapper
+
+def run_sync(coro):
+    """Run a data-layer coroutine from synchronous code and return its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _background.loop).result()
+
+def connect():
+    """Create the shared client now instead of on the first call, e.g. during warm-up."""
+    run_sync(_get_client())
+
+def close():
+    """Close the shared client's connections and stop the background loop."""
+    global _client
+    if _client is not None:
+        http_client = _client.options.httpx_client
+        if http_client is not None:
+            run_sync(http_client.aclose())
+        _client = None
+    loop = _background.loop
+    loop.call_soon_threadsafe(loop.stop)
+
+@track_supabase
+@_on_background_loop
 async def sign_up(email: str, password: str):
     """Register a new user with email and password."""
     try:
-        response = supabase.auth.sign_up({
+        client = await _get_client()
+        response = await client.auth.sign_up({
             "email": email,
             "password": password
         })
@@ -24,10 +138,13 @@ async def sign_up(email: str, password: str):
     except Exception as e:
         return None, str(e)
 
+@track_supabase
+@_on_background_loop
 async def sign_in(email: str, password: str):
     """Sign in an existing user with email and password."""
     try:
-        response = supabase.auth.sign_in_with_password({
+        client = await _get_client()
+        response = await client.auth.sign_in_with_password({
             "email": email,
             "password": password
         })
@@ -39,77 +156,154 @@ async def sign_in(email: str, password: str):
             }, None
         return None, "Login failed: Invalid credentials"
     except Exception as e:
-        print(f"Login error: {str(e)}")  # Debug logging
+        logger.warning("Login error: %s", e)
         return None, str(e)
 
+@track_supabase
+@_on_background_loop
 async def sign_out(session):
     """Sign out the current user."""
     try:
-        supabase.auth.sign_out()
+        client = await _get_client()
+        await client.auth.sign_out()
         return True, None
     except Exception as e:
         return False, str(e)
 
+@track_supabase
+@_on_background_loop
 async def get_user(access_token: str):
     """Get user details from access token."""
     try:
-        response = supabase.auth.get_user(access_token)
+        client = await _get_client()
+        response = await client.auth.get_user(access_token)
         if response.user:
             return response.user, None
         return None, "User not found"
     except Exception as e:
         return None, str(e)
 
-async def save_thread(user_id: str, title: str, content: list):
-    """Save a thread to Supabase database."""
+@track_supabase
+@_on_background_loop
+async def upsert_threads(rows: list):
+    """Upsert several threads with one bulk request.
+
+    Each row is a ``threads`` row including its ``id``, so retried writes
+    from the local store are idempotent. The batch succeeds or fails as a whole.
+    """
     try:
-        response = supabase.table('threads').insert({
-            'user_id': user_id,
-            'title': title,
-            'content': content,
-        }).execute()
-        return response.data[0] if response.data else None, None
+        client = await _get_client()
+        response = await client.table('threads').upsert(rows).execute()
+        return response.data, None
     except Exception as e:
         return None, str(e)
 
+@track_supabase
+@_on_background_loop
 async def get_user_threads(user_id: str):
     """Get all threads for a user."""
     try:
-        response = supabase.table('threads').select('*').eq('user_id', user_id).execute()
+        client = await _get_client()
+        response = await client.table('threads').select('*').eq('user_id', user_id).execute()
         return response.data, None
     except Exception as e:
         return None, str(e)
 
+def encode_cursor(created_at: str, thread_id: str) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps([created_at, thread_id]).encode()).decode()
+
+def decode_cursor(cursor: str):
+    """Return the ``(created_at, id)`` position of a cursor, normalized.
+
+    The values go into a PostgREST filter, so anything but an ISO 8601
+    timestamp and a UUID raises ValueError.
+    """
+    try:
+        created_at, thread_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(created_at, str) or not isinstance(thread_id, str):
+            raise ValueError("cursor values must be strings")
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(thread_id))
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+@track_supabase
+@_on_background_loop
+async def get_user_threads_page(user_id: str, limit: int = 20, cursor: str = None):
+    """Get one page of a user's thread summaries, newest first.
+
+    Uses keyset pagination on (user_id, created_at, id) and selects only
+    summary columns. Returns ``{'threads': [...], 'next_cursor': str | None}``;
+    a malformed ``cursor`` is reported as an error.
+    """
+    try:
+        client = await _get_client()
+        query = client.table('threads').select('id,title,created_at,post_count').eq('user_id', user_id)
+        if cursor:
+            created_at, thread_id = decode_cursor(cursor)
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{thread_id})'
+            )
+        response = await query.order('created_at', desc=True).order('id', desc=True).limit(limit + 1).execute()
+        rows = response.data or []
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return {'threads': rows, 'next_cursor': next_cursor}, None
+    except Exception as e:
+        return None, str(e)
+
+@track_supabase
+@_on_background_loop
 async def get_thread(thread_id: str):
     """Get a specific thread by ID."""
     try:
-        response = supabase.table('threads').select('*').eq('id', thread_id).single().execute()
+        client = await _get_client()
+        response = await client.table('threads').select('*').eq('id', thread_id).single().execute()
+        return response.data, None
+    except Exception as e:
+        return None, str(e)
+
+@track_supabase
+@_on_background_loop
+async def get_threads(thread_ids: list):
+    """Get several threads by ID with one request."""
+    try:
+        client = await _get_client()
+        response = await client.table('threads').select('*').in_('id', thread_ids).execute()
         return response.data, None
     except Exception as e:
         return None, str(e)
 
+@track_supabase
+@_on_background_loop
 async def delete_thread(thread_id: str, user_id: str):
     """Delete a thread."""
     try:
-        response = supabase.table('threads').delete().eq('id', thread_id).eq('user_id', user_id).execute()
+        client = await _get_client()
+        response = await client.table('threads').delete().eq('id', thread_id).eq('user_id', user_id).execute()
         return True, None
     except Exception as e:
         return False, str(e)
 
+@track_supabase
+@_on_background_loop
 async def get_user_config(user_id: str):
     """Get user configuration."""
     try:
-        print(f"Fetching config for user {user_id}")  # Debug log
+        client = await _get_client()
+        logger.debug("Fetching config for user %s", user_id)
         
         # First try to get existing config
         try:
-            response = supabase.table('user_configs').select('*').eq('user_id', user_id).execute()
+            response = await client.table('user_configs').select('*').eq('user_id', user_id).execute()
             if response and response.data and len(response.data) > 0:
                 return response.data[0], None
         except Exception as e:
-            print(f"Error fetching config: {str(e)}")  # Debug log
+            logger.warning("Error fetching config for user %s: %s", user_id, e)
         
-        print("No existing config found, creating default")  # Debug log
+        logger.info("No config found for user %s, creating default", user_id)
         # If no config exists, create default config
         default_config = {
             'user_id': user_id,
@@ -125,43 +319,45 @@ async def get_user_config(user_id: str):
             }
         }
         
-        insert_response = supabase.table('user_configs').insert(default_config).execute()
-        print(f"Insert response: {insert_response}")  # Debug log
+        insert_response = await client.table('user_configs').insert(default_config).execute()
+        logger.debug("Insert response: %s", insert_response)
         
         if insert_response and insert_response.data and len(insert_response.data) > 0:
             return insert_response.data[0], None
         return None, "Failed to create default configuration"
     except Exception as e:
-        print(f"Error in get_user_config: {str(e)}")  # Debug log
+        logger.error("Error in get_user_config: %s", e)
         return None, str(e)
 
+@track_supabase
+@_on_background_loop
 async def update_user_config(user_id: str, config_data: dict):
     """Update user configuration."""
     try:
-        print(f"Updating config for user {user_id}")  # Debug log
-        print(f"Config data: {config_data}")  # Debug log
+        client = await _get_client()
+        logger.debug("Updating config for user %s: %s", user_id, config_data)
         
         # Ensure user_id is included in the update
         config_data['user_id'] = user_id
         
         # First try to get existing config
         try:
-            existing_response = supabase.table('user_configs').select('*').eq('user_id', user_id).execute()
+            existing_response = await client.table('user_configs').select('*').eq('user_id', user_id).execute()
             if existing_response and existing_response.data and len(existing_response.data) > 0:
                 # Update existing config
-                response = supabase.table('user_configs').update(config_data).eq('user_id', user_id).execute()
+                response = await client.table('user_configs').update(config_data).eq('user_id', user_id).execute()
             else:
                 # Insert new config
-                response = supabase.table('user_configs').insert(config_data).execute()
+                response = await client.table('user_configs').insert(config_data).execute()
             
-            print(f"Update/Insert response: {response}")  # Debug log
+            logger.debug("Update/Insert response: %s", response)
             
             if response and response.data and len(response.data) > 0:
                 return response.data[0], None
             return None, "Failed to update configuration"
         except Exception as e:
-            print(f"Database operation failed: {str(e)}")  # Debug log
+            logger.error("Config update failed for user %s: %s", user_id, e)
             return None, str(e)
     except Exception as e:
-        print(f"Error in update_user_config: {str(e)}")  # Debug log
+        logger.error("Error in update_user_config: %s", e)
         return None, str(e) 
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""Background warm-up of modules and clients that the app otherwise loads on first use."""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class WarmUp:
+    """Run ``(name, fn)`` steps in order on a daemon thread and report progress.
+
+    A failed step is logged and recorded but does not stop the others; the
+    work it skipped happens lazily on first use instead. ``ready`` turns
+    true once every step has run, or straight away when warm-up is disabled.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]], enabled: bool = True):
+        self.steps = steps
+        self.enabled = enabled
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._done = threading.Event()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if not enabled:
+            self._done.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or not self.enabled:
+                return
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        for name, fn in self.steps:
+            started = time.perf_counter()
+            error = None
+            try:
+                fn()
+            except Exception as e:
+                logger.warning("Warm-up step %s failed: %s", name, e)
+                error = str(e)
+            with self._lock:
+                self._results[name] = {"seconds": round(time.perf_counter() - started, 3), "error": error}
+        with self._lock:
+            self._finished_at = time.monotonic()
+        self._done.set()
+        logger.info("Warm-up finished in %.2fs", self._finished_at - self._started_at)
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm-up has finished; False if ``timeout`` ran out first."""
+        return self._done.wait(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        """Return readiness and per-step timings."""
+        with self._lock:
+            if not self.enabled:
+                state = "disabled"
+            elif self._finished_at is not None:
+                state = "done"
+            else:
+                state = "running" if self._started_at is not None else "pending"
+            elapsed = None
+            if self._started_at is not None:
+                elapsed = round((self._finished_at or time.monotonic()) - self._started_at, 3)
+            return {
+                "ready": self.ready,
+                "state": state,
+                "seconds": elapsed,
+                "steps": dict(self._results),
+            }